@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import resource
+import numpy as np
+import networkx as nx
+from PIL import Image
+
+import file_io
+import graph
+import cluster
+import image
+import graphstream
+import cache
+import csr
+import utils
+import report
+import genGraphStream
+
+MIN_COMPARED_WALL_TIME = 0.1 # stages faster than this in the baseline and in the results are too noisy to be flagged as slower
+STAGES = ['read', 'assign', 'split', 'order', 'dgs', 'layout', 'cluster', 'color', 'frames', 'tile', 'encode']
+
+# Stubs of the external tools, replacing the tools by fast local scripts producing outputs in the expected formats
+OSLOM2_STUB = '''#!{python}
+# oslom_undir stub: one module per block of 50 consecutive node ids
+import os, sys
+edge_file = sys.argv[sys.argv.index('-f') + 1]
+nodes = set()
+with open(edge_file) as f:
+    for line in f:
+        nodes.update(line.split()[:2])
+modules = {{}}
+for node in nodes:
+    modules.setdefault(int(node) // 50, []).append(node)
+os.makedirs(edge_file + '_oslo_files', exist_ok=True)
+with open(os.path.join(edge_file + '_oslo_files', 'tp'), 'w') as f:
+    for module_id, module_nodes in enumerate(modules.values()):
+        f.write('#module {{}} size: {{}} bs: 0.0\\n{{}}\\n'.format(module_id, len(module_nodes), ' '.join(module_nodes)))
+'''
+
+GVMAP_STUB = '''#!{python}
+# gvmap stub: fill color of each node from its cluster
+import re, sys
+print('graph {{')
+with open(sys.argv[-1]) as f:
+    for line in f:
+        match = re.match(r'^"([^"]+)" \\[.*?cluster=(\\d+)', line)
+        if match:
+            print('"{{}}" [fillcolor="#{{:06x}}"];'.format(match.group(1), int(match.group(2)) * 2654435761 % 0xffffff))
+print('}}')
+'''
+
+FFMPEG_STUB = '''#!{python}
+# ffmpeg stub: consume the raw frames streamed on stdin and write an empty video file
+import sys
+if '-' in sys.argv:
+    while sys.stdin.buffer.read(1 << 20):
+        pass
+open(sys.argv[-1], 'wb').close()
+'''
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=
+        '''Benchmark each stage of genGraphStream.py on synthetic graphs with planted partitions
+        and record the wall time, peak memory and output size of each stage as JSON.'''
+    )
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="increase output verbosity")
+    parser.add_argument("-j", "--jobs", type=int, default=1, metavar='N',
+                        help="number of partitions processed in parallel (default=1)")
+    parser.add_argument("--render-threads", type=int, default=1, metavar='N',
+                        help="number of threads rendering the frames of each partition (default=1)")
+    parser.add_argument('-o', '--output_dir', default='benchmark_output',
+                        help='output directory (default=benchmark_output)')
+    # Synthetic graphs
+    graph_group = parser.add_argument_group('synthetic graph options')
+    graph_group.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000], metavar='N',
+                        help='number of nodes of each benchmarked graph (default=1000 10000 100000)')
+    graph_group.add_argument('--partitions', type=int, default=4, metavar='P',
+                        help='number of partitions (default=4)')
+    graph_group.add_argument('--cut-ratio', type=float, default=0.1, metavar='R',
+                        help='ratio of edges between 2 partitions (default=0.1)')
+    graph_group.add_argument('--degree', type=int, default=8, metavar='D',
+                        help='average node degree (default=8)')
+    graph_group.add_argument('--formats', nargs='+', choices=['metis', 'edgelist', 'gml'], default=['metis', 'edgelist', 'gml'],
+                        help='graph file formats benchmarked by the read stage, the next stages use the metis graph (default=metis edgelist gml)')
+    graph_group.add_argument('--seed', type=int, default=0, metavar='S',
+                        help='seed of the synthetic graphs and of the pipeline (default=0)')
+    # Pipeline
+    pipeline_group = parser.add_argument_group('pipeline options')
+    pipeline_group.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES,
+                        help='stages to record, the stages they depend on are run but not recorded (default=all)')
+    pipeline_group.add_argument('--clustering', choices=['oslom2', 'label-propagation'], default='label-propagation',
+                        help='clustering method (default=label-propagation)')
+    pipeline_group.add_argument('--coloring', choices=['gvmap', 'dsatur'], default='dsatur',
+                        help='coloring method (default=dsatur)')
+    pipeline_group.add_argument('--max-frames', type=int, default=100, metavar='F',
+                        help='maximum number of animation steps, nodes being grouped into steps (default=100)')
+    pipeline_group.add_argument('--width', type=int, default=1280, metavar='W',
+                        help='image width (default=1280)')
+    pipeline_group.add_argument('--height', type=int, default=720, metavar='H',
+                        help='image height (default=720)')
+    pipeline_group.add_argument('--fps', type=int, default=8, metavar='FPS',
+                        help='frames per second of the video (default=8)')
+    pipeline_group.add_argument('--stub-tools', action='store_true',
+                        help='replace OSLOM2, gvmap and ffmpeg by local stubs to benchmark the Python and Java stages in isolation')
+    pipeline_group.add_argument('--config', default='config.ini',
+                        help='config file with the installation directories of the external tools (default=config.ini)')
+    # Results
+    results_group = parser.add_argument_group('results options')
+    results_group.add_argument('--baseline', metavar='FILE',
+                        help='write the results to this JSON file')
+    results_group.add_argument('--compare', metavar='FILE',
+                        help='compare the results with a JSON baseline, exit with an error if a stage is slower than the tolerance')
+    results_group.add_argument('--tolerance', type=float, default=0.2, metavar='T',
+                        help='allowed wall time increase ratio over the baseline (default=0.2)')
+    results_group.add_argument('--check-render-threads', action='store_true',
+                        help='render the frames again on the layout thread and compare them pixel by pixel with the frames rendered by the --render-threads threads, exit with an error if they differ')
+    args = parser.parse_args()
+
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG, format="%(levelname)s: %(message)s")
+    else:
+        logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+    errors = []
+    if args.partitions < 2:
+        errors.append("The --partitions value must be at least 2")
+    if args.cut_ratio < 0 or args.cut_ratio > 1:
+        errors.append("The --cut-ratio value must be between 0 and 1")
+    if any(size < args.partitions for size in args.sizes):
+        errors.append("The --sizes values must be at least the number of partitions")
+    if args.compare and not os.path.isfile(args.compare):
+        errors.append("The baseline file {} cannot be found".format(args.compare))
+    if args.check_render_threads and (args.render_threads < 2 or STAGES.index('frames') > max(STAGES.index(stage) for stage in args.stages)):
+        errors.append("The --check-render-threads option requires a --render-threads value of at least 2 and the frames stage")
+    if errors:
+        for error in errors:
+            logging.error(error)
+        sys.exit(1)
+    return args
+
+def generate_graph(node_count, partition_count, cut_ratio, degree, seed):
+    '''
+    Random graph with planted partitions of equal sizes, each edge joining 2 partitions with probability cut_ratio.
+    Returns the unique edges (source < target, without self-loops) and the partition of each node.
+    '''
+    rng = np.random.RandomState(seed)
+    partitions = rng.permutation(node_count) % partition_count
+    nodes_by_partition = np.argsort(partitions, kind='stable')
+    partition_starts = np.searchsorted(partitions[nodes_by_partition], np.arange(partition_count + 1))
+
+    edge_count = node_count * degree // 2
+    sources = rng.randint(node_count, size=edge_count)
+    target_partitions = partitions[sources]
+    cut = rng.random_sample(edge_count) < cut_ratio
+    target_partitions[cut] = (target_partitions[cut] + rng.randint(1, partition_count, size=np.count_nonzero(cut))) % partition_count
+    partition_sizes = partition_starts[target_partitions + 1] - partition_starts[target_partitions]
+    targets = nodes_by_partition[partition_starts[target_partitions] + (rng.random_sample(edge_count) * partition_sizes).astype(np.int64)]
+
+    edges = np.sort(np.column_stack((sources, targets)), axis=1)
+    edges = np.unique(edges[edges[:, 0] != edges[:, 1]], axis=0)
+    return edges, partitions
+
+def write_metis_file(filepath, node_count, edges):
+    sources = np.concatenate((edges[:, 0], edges[:, 1]))
+    targets = np.concatenate((edges[:, 1], edges[:, 0]))
+    order = np.lexsort((targets, sources))
+    neighbors = (targets[order] + 1).astype(str).tolist() # 1-based node ids
+    indptr = np.zeros(node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=node_count), out=indptr[1:])
+    with open(filepath, 'w') as f:
+        f.write('{} {}\n'.format(node_count, len(edges)))
+        f.write(''.join(' '.join(neighbors[begin:end]) + '\n' for begin, end in zip(indptr[:-1].tolist(), indptr[1:].tolist())))
+
+def write_edgelist_file(filepath, edges):
+    np.savetxt(filepath, edges, fmt='%d')
+
+def write_gml_file(filepath, node_count, edges):
+    with open(filepath, 'w') as f:
+        f.write('graph [\n')
+        f.write(''.join('  node [\n    id {0}\n    label "{0}"\n  ]\n'.format(node) for node in range(node_count)))
+        f.write(''.join('  edge [\n    source {}\n    target {}\n  ]\n'.format(source, target) for source, target in edges.tolist()))
+        f.write(']\n')
+
+def write_stub_tools(directory):
+    ''' Write the stubs of the external tools, returns their installation directories '''
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    for name, stub in [('oslom_undir', OSLOM2_STUB), ('gvmap', GVMAP_STUB), ('ffmpeg', FFMPEG_STUB)]:
+        stub_file = os.path.join(directory, name)
+        with open(stub_file, 'w') as f:
+            f.write(stub.format(python=sys.executable))
+        os.chmod(stub_file, 0o755)
+    os.environ['PATH'] = os.path.abspath(directory) + os.pathsep + os.environ['PATH'] # ffmpeg is run from the PATH
+    return {'oslom2': directory, 'gvmap': directory}
+
+def measure(results, stage, output_dir, function, *args, **kwargs):
+    ''' Run a stage function and record its wall time, peak memory and the bytes it wrote in the output directory '''
+    logging.info("Running %s stage", stage)
+    size_before = cache.get_path_size(output_dir)
+    sampler = report.MemorySampler()
+    sampler.start()
+    start = time.perf_counter()
+    value = function(*args, **kwargs)
+    wall_time = time.perf_counter() - start
+    results[stage] = {'wall_time': round(wall_time, 4),
+                      'peak_rss': sampler.stop(),
+                      'children_peak_rss': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024, # peak of all the terminated subprocesses so far
+                      'output_bytes': max(0, cache.get_path_size(output_dir) - size_before)}
+    logging.info("%s stage: %.3fs, peak memory %.1f MB", stage, wall_time, results[stage]['peak_rss'] / (1024 * 1024))
+    return value
+
+def set_random_positions(sub_graphs, seed):
+    ''' Random node positions replacing the layout stage when GraphStream is not available '''
+    rng = np.random.RandomState(seed)
+    for sub_graph in sub_graphs:
+        node_ids = np.array(list(sub_graph.nodes()), dtype=np.int64)
+        sub_graph.graph['positions'] = (node_ids, rng.random_sample((len(node_ids), 2)) * 1000.0)
+    return sub_graphs
+
+def write_blank_frames(output_dir, frame_start_and_count_per_partition, width, height):
+    ''' Blank partition frames replacing the frames stage when GraphStream is not available '''
+    frames_dir = os.path.join(output_dir, 'frames_partition')
+    if not os.path.exists(frames_dir):
+        os.makedirs(frames_dir)
+    blank_frame = os.path.join(output_dir, 'blank.png')
+    Image.new('RGB', (width, height), image.BACKGROUND_COLOR).save(blank_frame)
+    for partition, frame_count in file_io.get_frame_count_per_partition(frame_start_and_count_per_partition).items():
+        for frame in range(frame_count):
+            shutil.copyfile(blank_frame, os.path.join(frames_dir, 'p{}_{:06d}_new.png'.format(partition, frame)))
+    os.remove(blank_frame)
+
+def compare_frames(frames_dir, other_frames_dir):
+    ''' Names of the png frames missing from one of the 2 directories or differing by at least one pixel '''
+    frames = {filename for filename in os.listdir(frames_dir) if filename.endswith('.png')}
+    other_frames = {filename for filename in os.listdir(other_frames_dir) if filename.endswith('.png')}
+    mismatches = frames ^ other_frames
+    for filename in frames & other_frames:
+        with Image.open(os.path.join(frames_dir, filename)) as frame, Image.open(os.path.join(other_frames_dir, filename)) as other_frame:
+            if frame.size != other_frame.size or frame.convert('RGBA').tobytes() != other_frame.convert('RGBA').tobytes():
+                mismatches.add(filename)
+    return sorted(mismatches)
+
+def check_render_threads(output_dir, sub_graphs, frame_start_and_count_per_partition, args, pool):
+    '''
+    Render the frames again on the layout thread (replaying the trajectories of the layout stage) and compare them with the frames
+    rendered by the render threads, which are kept for the next stages. Returns the names of the differing frames.
+    '''
+    frames_dir = os.path.join(output_dir, 'frames_partition')
+    threaded_frames_dir = os.path.join(output_dir, 'frames_partition_threads')
+    os.rename(frames_dir, threaded_frames_dir)
+    os.makedirs(frames_dir)
+    logging.info("Rendering the frames on the layout thread to compare them with the frames rendered by %d threads", args.render_threads)
+    genGraphStream.create_dgs_file_and_generate_frames(output_dir, sub_graphs, frame_start_and_count_per_partition,
+                    'id', 'fillcolor', 'springbox', args.seed, None, 0.012, 0.024, None, None, None, 'fixed', None, 1, 10, 0, args.width, args.height, 'images', 'file', pool,
+                    render_threads=1)
+    mismatches = compare_frames(frames_dir, threaded_frames_dir)
+    shutil.rmtree(frames_dir)
+    os.rename(threaded_frames_dir, frames_dir)
+    if mismatches:
+        logging.error("%d frames rendered by %d threads differ from the frames rendered on the layout thread: %s",
+                      len(mismatches), args.render_threads, ', '.join(mismatches[:10]))
+    else:
+        logging.info("The frames rendered by %d threads are identical to the frames rendered on the layout thread", args.render_threads)
+    return mismatches
+
+def run_benchmark(args, node_count, install_dirs, java_available):
+    ''' Run the pipeline stages on a synthetic graph, returns the results of the recorded stages '''
+    output_dir = os.path.join(args.output_dir, 'n{}'.format(node_count))
+    utils.create_or_clean_output_dir(output_dir)
+    last_stage = max(STAGES.index(stage) for stage in args.stages)
+    run_stage = lambda stage: STAGES.index(stage) <= last_stage
+    stage_results = {}
+
+    # Generate the graph files and assignments (not recorded)
+    logging.info("Generating synthetic graph with %d nodes", node_count)
+    edges, partitions = generate_graph(node_count, args.partitions, args.cut_ratio, args.degree, args.seed)
+    input_dir = os.path.join(output_dir, 'inputs')
+    os.makedirs(input_dir)
+    graph_files = {fmt:os.path.join(input_dir, 'graph.{}'.format(fmt)) for fmt in ['metis', 'edgelist', 'gml']}
+    write_metis_file(graph_files['metis'], node_count, edges)
+    if 'edgelist' in args.formats:
+        write_edgelist_file(graph_files['edgelist'], edges)
+    if 'gml' in args.formats:
+        write_gml_file(graph_files['gml'], node_count, edges)
+    assignments_file = os.path.join(input_dir, 'assignments.txt')
+    np.savetxt(assignments_file, partitions, fmt='%d')
+    results = {'nodes': node_count, 'edges': len(edges), 'cut_edges': int(np.count_nonzero(partitions[edges[:, 0]] != partitions[edges[:, 1]])),
+               'stages': stage_results}
+
+    # Read (once per format, the next stages use the metis graph)
+    for fmt in args.formats:
+        format_graph = measure(stage_results, 'read[{}]'.format(fmt), output_dir, file_io.read_graph_from_file, graph_files[fmt], fmt)
+        if fmt == 'metis':
+            input_graph = format_graph
+    if 'metis' not in args.formats:
+        input_graph = file_io.read_graph_from_file(graph_files['metis'], 'metis')
+    if 'read' not in args.stages:
+        stage_results.clear()
+
+    # Assign, split and order
+    recorded = lambda stage: stage_results if stage in args.stages else {}
+    if run_stage('assign'):
+        assignments = measure(recorded('assign'), 'assign', output_dir, genGraphStream.get_assignments, assignments_file, False, None, None, None,
+                              input_graph, None, None, None, 'weight', 'weight', args.seed)
+        partition_ids = genGraphStream.get_partitions(assignments)
+    if run_stage('split'):
+        sub_graphs = measure(recorded('split'), 'split', output_dir, lambda: graph.create_sub_graphs(input_graph, partition_ids, assignments))
+        graph.add_node_size_to_subgraphs(input_graph, sub_graphs, 'fixed', 20, 20, 60)
+    if run_stage('order'):
+        def order_nodes():
+            node_order = genGraphStream.get_node_order(None, args.seed, nx.number_of_nodes(input_graph))
+            genGraphStream.filter_node_order(node_order, assignments)
+            graph.add_node_order_to_subgraphs(sub_graphs, node_order)
+        measure(recorded('order'), 'order', output_dir, order_nodes)
+
+    # DGS files
+    if run_stage('dgs'):
+        def write_dgs_files():
+            full_graph = csr.CSRGraph.from_networkx(sub_graphs, {'order': ('int64', 0), 'partition': ('int32', -1)})
+            padding_frame_count = args.fps * 2
+            nodes_per_frame = genGraphStream.get_nodes_per_frame(full_graph.number_of_nodes(), None, args.max_frames)
+            frame_start_and_count_per_partition = file_io.get_frame_start_and_count_per_partition(full_graph, padding_frame_count, nodes_per_frame)
+            for sub_graph in sub_graphs:
+                file_io.write_dgs_file(output_dir, sub_graph, frame_start_and_count_per_partition, 'id', None)
+            return full_graph, frame_start_and_count_per_partition
+        full_graph, frame_start_and_count_per_partition = measure(recorded('dgs'), 'dgs', output_dir, write_dgs_files)
+
+    # Layout (random positions without GraphStream)
+    pool = graphstream.WorkerPool(genGraphStream.DGSGS_JAR, args.jobs, output_dir) if java_available and run_stage('layout') else None
+    if run_stage('layout'):
+        if pool:
+            measure(recorded('layout'), 'layout', output_dir, genGraphStream.generate_layout_per_subgraph, sub_graphs, frame_start_and_count_per_partition, output_dir,
+                    'springbox', args.seed, None, 0.012, 0.024, None, None, None, 'fixed', None, 1, 10, 'id', 0, args.width, args.height, 'file', pool)
+        else:
+            set_random_positions(sub_graphs, args.seed)
+            recorded('layout')['layout'] = {'skipped': 'GraphStream is not available, random positions used'}
+
+    # Cluster and color
+    if run_stage('cluster'):
+        clusters_per_node_per_graph = measure(recorded('cluster'), 'cluster', output_dir, genGraphStream.create_clusters, sub_graphs, full_graph, output_dir,
+                                              'communities', args.clustering, args.seed, 0, args.jobs)
+        cluster.add_clusters_to_graph(sub_graphs, clusters_per_node_per_graph)
+    if run_stage('color'):
+        colors_per_node = measure(recorded('color'), 'color', output_dir, genGraphStream.perform_coloring, sub_graphs, clusters_per_node_per_graph, output_dir,
+                                  install_dirs.get('gvmap'), None, args.coloring, 'pastel', args.seed)
+        graph.add_node_attribute_to_subgraphs(sub_graphs, 'fillcolor', colors_per_node)
+
+    # Frames (blank frames without GraphStream)
+    if run_stage('frames'):
+        if pool:
+            measure(recorded('frames'), 'frames', output_dir, genGraphStream.create_dgs_file_and_generate_frames, output_dir, sub_graphs, frame_start_and_count_per_partition,
+                    'id', 'fillcolor', 'springbox', args.seed, None, 0.012, 0.024, None, None, None, 'fixed', None, 1, 10, 0, args.width, args.height, 'images', 'file', pool,
+                    render_threads=args.render_threads)
+            if args.check_render_threads:
+                results['render_threads_mismatches'] = check_render_threads(output_dir, sub_graphs, frame_start_and_count_per_partition, args, pool)
+        else:
+            write_blank_frames(output_dir, frame_start_and_count_per_partition, args.width, args.height)
+            recorded('frames')['frames'] = {'skipped': 'GraphStream is not available, blank frames used'}
+            if args.check_render_threads:
+                logging.warning("GraphStream is not available, the frames rendered by the render threads are not checked")
+    if pool:
+        pool.close()
+
+    # Tiles and video
+    if run_stage('tile'):
+        measure(recorded('tile'), 'tile', output_dir, image.combine_images_into_tiles, output_dir, partition_ids, 1, args.width, args.height, args.fps, args.jobs, None)
+    if run_stage('encode'):
+        if shutil.which('ffmpeg'):
+            measure(recorded('encode'), 'encode', output_dir, genGraphStream.create_video_from_tiles, output_dir, os.path.join(output_dir, 'video.mp4'), args.fps)
+        else:
+            recorded('encode')['encode'] = {'skipped': 'ffmpeg is not available'}
+
+    return results
+
+def compare_results(results, baseline, tolerance):
+    ''' Log the wall time of each stage against the baseline, returns the number of stages slower than the tolerance '''
+    regressions = 0
+    for size, size_results in results['sizes'].items():
+        baseline_stages = baseline['sizes'].get(size, {}).get('stages', {})
+        for stage, stage_results in size_results['stages'].items():
+            if 'wall_time' not in stage_results or 'wall_time' not in baseline_stages.get(stage, {}):
+                continue
+            wall_time, baseline_wall_time = stage_results['wall_time'], baseline_stages[stage]['wall_time']
+            change = (wall_time - baseline_wall_time) / baseline_wall_time if baseline_wall_time else 0.0
+            logging.info("[%s nodes] %-15s %9.3fs -> %9.3fs (%+.1f%%)", size, stage, baseline_wall_time, wall_time, change * 100)
+            if change > tolerance and max(wall_time, baseline_wall_time) >= MIN_COMPARED_WALL_TIME:
+                logging.warning("[%s nodes] %s stage is %.1f%% slower than the baseline", size, stage, change * 100)
+                regressions += 1
+    return regressions
+
+if __name__ == '__main__':
+    args = parse_arguments()
+
+    # External tools (GraphStream stages only run if Java and the jar are available)
+    if args.stub_tools:
+        install_dirs = write_stub_tools(os.path.join(args.output_dir, 'stubs'))
+    else:
+        install_dirs = dict(genGraphStream.parse_config_file(args.config)['install_dirs']) if os.path.isfile(args.config) else {}
+    genGraphStream.config = {'install_dirs': install_dirs}
+    java_available = bool(shutil.which('java')) and os.path.isfile(genGraphStream.DGSGS_JAR)
+    if not java_available:
+        logging.warning("GraphStream is not available (java or %s not found), the layout and frames stages are skipped", genGraphStream.DGSGS_JAR)
+
+    results = {'parameters': {'partitions': args.partitions, 'cut_ratio': args.cut_ratio, 'degree': args.degree, 'seed': args.seed, 'jobs': args.jobs, 'render_threads': args.render_threads,
+                              'clustering': args.clustering, 'coloring': args.coloring, 'max_frames': args.max_frames,
+                              'width': args.width, 'height': args.height, 'stub_tools': args.stub_tools},
+               'platform': {'python': platform.python_version(), 'system': platform.platform(), 'cpu_count': os.cpu_count()},
+               'sizes': {}}
+    for node_count in args.sizes:
+        results['sizes'][str(node_count)] = run_benchmark(args, node_count, install_dirs, java_available)
+
+    if args.baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        logging.info("Results written to %s", args.baseline)
+
+    if args.check_render_threads and any(size_results.get('render_threads_mismatches') for size_results in results['sizes'].values()):
+        sys.exit(1)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        if compare_results(results, baseline, args.tolerance):
+            sys.exit(1)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import pickle
+import hashlib
+import logging
+
+def get_file_hash(filepath):
+    ''' SHA-256 of a file content (None if no file is given) '''
+    if not filepath:
+        return None
+    sha = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def get_code_version(filepaths):
+    ''' Hash of the content of the code files (missing files are skipped), so that entries written by another version are not reused '''
+    sha = hashlib.sha256()
+    for filepath in sorted(filepaths):
+        if os.path.isfile(filepath):
+            sha.update(get_file_hash(filepath).encode('utf-8'))
+    return sha.hexdigest()
+
+def get_path_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    size = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            size += os.path.getsize(os.path.join(root, file))
+    return size
+
+class StageCache:
+    '''
+    Content-addressed cache of the pipeline stages. Each entry is a directory named after
+    the hash of the stage inputs (input file hashes, arguments and keys of the previous
+    stages) holding the pickled stage result and a copy of the files written by the stage.
+    Entries are evicted in least-recently-used order when the cache exceeds max_size bytes.
+    The code version is part of every key. The cache is disabled when no directory is given.
+    '''
+    def __init__(self, directory, max_size, version=None):
+        self.directory = directory
+        self.max_size = max_size
+        self.version = version
+        if self.directory and not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    def get_key(self, stage, *inputs):
+        ''' Key of a stage from its name and inputs '''
+        sha = hashlib.sha256(stage.encode('utf-8'))
+        sha.update(repr(self.version).encode('utf-8'))
+        for value in inputs:
+            sha.update(repr(value).encode('utf-8'))
+        return sha.hexdigest()
+
+    def run(self, stage, key, paths, function, *args):
+        ''' Run a stage function, or reuse its cached result and restore its output paths if the key matches '''
+        if self.directory:
+            hit, value = self.load(key, paths)
+            if hit:
+                logging.info("Reusing cached %s stage (%s)", stage, key[:12])
+                return value
+        value = function(*args)
+        if self.directory:
+            self.store(key, value, paths)
+        return value
+
+    def load(self, key, paths):
+        entry = os.path.join(self.directory, key)
+        if not os.path.isdir(entry):
+            return False, None
+        with open(os.path.join(entry, 'value.pickle'), 'rb') as f:
+            value = pickle.load(f)
+        # restore files and directories written by the stage
+        for index, path in enumerate(paths):
+            cached_path = os.path.join(entry, 'files', str(index))
+            if os.path.isdir(cached_path):
+                if os.path.exists(path):
+                    shutil.rmtree(path)
+                shutil.copytree(cached_path, path)
+            elif os.path.isfile(cached_path):
+                if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                shutil.copy2(cached_path, path)
+        os.utime(entry) # mark entry as recently used
+        return True, value
+
+    def store(self, key, value, paths):
+        entry = os.path.join(self.directory, key)
+        temp_entry = os.path.join(self.directory, '{}.tmp{}'.format(key, os.getpid()))
+        if os.path.exists(temp_entry):
+            shutil.rmtree(temp_entry)
+        os.makedirs(os.path.join(temp_entry, 'files'))
+        with open(os.path.join(temp_entry, 'value.pickle'), 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # copy files and directories written by the stage
+        for index, path in enumerate(paths):
+            cached_path = os.path.join(temp_entry, 'files', str(index))
+            if os.path.isdir(path):
+                shutil.copytree(path, cached_path)
+            elif os.path.isfile(path):
+                shutil.copy2(path, cached_path)
+        with open(os.path.join(temp_entry, 'size'), 'w') as f:
+            f.write(str(get_path_size(temp_entry)))
+        if os.path.exists(entry):
+            shutil.rmtree(entry)
+        os.rename(temp_entry, entry)
+        self.evict()
+
+    def evict(self):
+        ''' Remove least recently used entries until the cache size is below max_size '''
+        entries = []
+        for name in os.listdir(self.directory):
+            entry = os.path.join(self.directory, name)
+            size_file = os.path.join(entry, 'size')
+            if os.path.isfile(size_file):
+                with open(size_file, 'r') as f:
+                    entries.append((os.path.getmtime(entry), int(f.read()), entry))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            logging.debug("Evicting cache entry %s (%d bytes)", entry, size)
+            shutil.rmtree(entry)
+            total_size -= size
@@ -1,14 +1,15 @@
 #!/usr/bin/env python3
 
 import os
-import tempfile
+import random
 import logging
 import itertools
 import subprocess
 
 from graph import add_node_attribute_to_graph
 import utils
-import networkx as nx
+import csr
+import report
 
 def add_clusters_to_graph(sub_graphs, clusters_per_node_per_graph):
     for index, clusters_per_node in enumerate(clusters_per_node_per_graph):
@@ -53,45 +54,97 @@ def do_local_to_global_cluster_conversion(clusters_per_node_per_graph):
 
     return local_to_global_cluster_mapping
 
-def run_oslom2(output_directory, edges_oslom_filename, oslom2_dir, cluster_seed, infomap_calls):
+def run_oslom2(output_directory, edges_oslom_filename, oslom2_dir, cluster_seed, infomap_calls, partition=None):
     """
     Use OSLOM to find clusters in graph
     http://www.oslom.org/
     http://www.oslom.org/code/ReadMe.pdf for documentation on program options
     """
 
-    temp_dir = tempfile.mkdtemp()
-    oslom_bin = os.path.join(oslom2_dir, "oslom_undir")
+    oslom_bin = os.path.abspath(os.path.join(oslom2_dir, "oslom_undir"))
     oslom_log = os.path.join(output_directory, "oslom.log")
 
     r = 10
     hr = 50
-    args = [oslom_bin, "-f", edges_oslom_filename, "-w", "-r", str(r), "-hr", str(hr), "-seed", str(cluster_seed), '-infomap', str(infomap_calls)]
+    args = [oslom_bin, "-f", os.path.abspath(edges_oslom_filename), "-w", "-r", str(r), "-hr", str(hr), "-seed", str(cluster_seed), '-infomap', str(infomap_calls)]
     logging.debug("oslom2 command: %s", ' '.join(args))
     with open(oslom_log, "a") as logwriter:
-        retval = subprocess.call(args, stdout=logwriter, stderr=subprocess.STDOUT)
+        retval = report.call('oslom2', args, partition, cwd=output_directory, stdout=logwriter, stderr=subprocess.STDOUT) # oslom2 writes temporary files in its working directory
 
-def run_infomap(output_directory, pajek_file, infomap_dir, cluster_seed):
+def run_infomap(output_directory, pajek_file, infomap_dir, cluster_seed, partition=None):
     infomap_bin = os.path.join(infomap_dir, "Infomap")
     num_trials = 1
     args = [infomap_bin, pajek_file, output_directory, '--seed', str(cluster_seed), ' --num-trials', str(num_trials), '--overlapping']
     logging.debug("infomap command: %s", ' '.join(args))
     log_file = os.path.join(output_directory, "infomap.log")
     with open(log_file, "a") as logwriter:
-        retval = subprocess.call(args, stdout=logwriter, stderr=subprocess.STDOUT)
+        retval = report.call('infomap', args, partition, stdout=logwriter, stderr=subprocess.STDOUT)
 
-def cluster_nodes_per_partition(sub_graphs):
-    full_graph_with_attributes = nx.union_all(sub_graphs)
+def run_label_propagation(graph, cluster_seed, max_iterations=100):
+    '''
+    Weighted label propagation run in process on the CSR arrays of the graph.
+    Nodes are visited in a random order seeded by cluster_seed and take the label with the highest
+    total edge weight among their neighbors (ties broken randomly, current label kept if tied),
+    until no label changes. Returns 1-based clusters per node as read_oslom2_tp_file.
+    '''
+    csr_graph = csr.CSRGraph.from_networkx([graph], weight='weight')
+    indptr = csr_graph.indptr.tolist()
+    indices = csr_graph.indices.tolist()
+    weights = csr_graph.weights.tolist()
+    node_count = csr_graph.number_of_nodes()
+
+    rng = random.Random(cluster_seed)
+    labels = list(range(node_count)) # each node starts in its own community
+    visit_order = list(range(node_count))
+    for iteration in range(max_iterations):
+        rng.shuffle(visit_order)
+        changed = False
+        for node in visit_order:
+            label_weights = {}
+            for index in range(indptr[node], indptr[node + 1]):
+                neighbor = indices[index]
+                if neighbor != node:
+                    label = labels[neighbor]
+                    label_weights[label] = label_weights.get(label, 0.0) + weights[index]
+            if not label_weights: # isolated node
+                continue
+            max_weight = max(label_weights.values())
+            if label_weights.get(labels[node]) == max_weight:
+                continue
+            best_labels = [label for label, weight in label_weights.items() if weight == max_weight]
+            labels[node] = best_labels[rng.randrange(len(best_labels))] if len(best_labels) > 1 else best_labels[0]
+            changed = True
+        if not changed:
+            break
+    logging.debug("Label propagation done in %d iterations", iteration + 1)
+
+    # 1-based (needed by gvmap) cluster ids in order of first appearance
+    cluster_ids = {}
+    clusters_per_node = {}
+    for node_id, label in zip(csr_graph.node_ids.tolist(), labels):
+        if not label in cluster_ids:
+            cluster_ids[label] = len(cluster_ids) + 1
+        clusters_per_node[node_id] = [cluster_ids[label]]
+    return clusters_per_node
+
+def cluster_nodes_per_partition(sub_graphs, full_graph):
+    partitions = full_graph.attributes['partition'] # partition column of the CSRGraph of all sub-graphs
     clusters_per_node_per_graph = []
     for sub_graph in sub_graphs:
         clusters_per_node = {}
+        hidden_nodes = []
+        external_nodes = []
         for node in sub_graph.nodes(data=True):
             if 'hidden' in node[1]: # give hidden node the partition of the external node they represent
                 connected_nodes = node[1]['connect']
-                external_node = connected_nodes[1] if connected_nodes[0] in sub_graph.nodes() else connected_nodes[0]
-                partition = full_graph_with_attributes.nodes[external_node]['partition']
+                hidden_nodes.append(node[0])
+                external_nodes.append(connected_nodes[1] if connected_nodes[0] in sub_graph else connected_nodes[0])
+                clusters_per_node[node[0]] = None # filled below, keeping the node order
             else:
-                partition = node[1]['partition']
-            clusters_per_node[node[0]] = [partition]
+                clusters_per_node[node[0]] = [node[1]['partition']]
+        if hidden_nodes:
+            external_partitions = partitions[full_graph.get_indices(external_nodes)].tolist()
+            for node, partition in zip(hidden_nodes, external_partitions):
+                clusters_per_node[node] = [partition]
         clusters_per_node_per_graph.append(clusters_per_node)
     return clusters_per_node_per_graph
\ No newline at end of file
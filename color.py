@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
 
 import os
+import heapq
+import random
+import colorsys
 import logging
 import subprocess
+import numpy as np
 import networkx as nx
+from scipy import spatial
 
 import utils
 import graph
+import report
 
 '''
 Combine single color per node (from gvmap) and multiple clusters per node (from OSLOM2) to get multiple colors per node
@@ -36,7 +42,7 @@ def color_nodes_with_gvmap(output_dir, color_scheme, seed, dot_filepath, gvmap_d
     args = [gvmap_bin, '-e', '-w', '-c', str(scheme), '-d', str(seed), dot_filepath] # "-w option is only available with this graphviz fork https://gitlab.com/paulantoineb/graphviz
     logging.debug("gvmap command: %s", ' '.join(args))
     output_file = open(output_dot_filename, "w")
-    retval = subprocess.call(
+    retval = report.call('gvmap',
             args, cwd='.',
             stderr=subprocess.STDOUT,
             stdout=output_file)
@@ -44,6 +50,75 @@ def color_nodes_with_gvmap(output_dir, color_scheme, seed, dot_filepath, gvmap_d
 
     return output_dot_filename
 
+def get_cluster_adjacency(sub_graphs, cluster_per_node):
+    '''
+    Pairs of clusters sharing an edge or touching on the map of a partition, ie. with 2 nodes
+    connected in the Delaunay triangulation of the node positions (as the regions drawn by gvmap)
+    '''
+    adjacent_clusters = set()
+    for sub_graph in sub_graphs:
+        for source, target in sub_graph.edges():
+            source_cluster, target_cluster = cluster_per_node.get(source), cluster_per_node.get(target)
+            if source_cluster is not None and target_cluster is not None and source_cluster != target_cluster:
+                adjacent_clusters.add((min(source_cluster, target_cluster), max(source_cluster, target_cluster)))
+
+        node_ids, positions = graph.get_positions(sub_graph)
+        clustered = np.fromiter((node in cluster_per_node for node in node_ids.tolist()), dtype=bool, count=len(node_ids))
+        positions = positions[clustered]
+        if len(positions) < 3 or np.linalg.matrix_rank(positions - positions.mean(axis=0)) < 2:
+            continue # no triangulation for less than 3 nodes or aligned nodes
+        clusters = np.array([cluster_per_node[node] for node in node_ids[clustered].tolist()])
+        simplices = spatial.Delaunay(positions).simplices
+        cluster_pairs = clusters[np.concatenate([simplices[:, [0, 1]], simplices[:, [1, 2]], simplices[:, [0, 2]]])]
+        cluster_pairs = np.sort(cluster_pairs[cluster_pairs[:, 0] != cluster_pairs[:, 1]], axis=1)
+        adjacent_clusters.update(map(tuple, np.unique(cluster_pairs, axis=0).tolist()))
+    return adjacent_clusters
+
+def get_dsatur_coloring(clusters, adjacent_clusters):
+    ''' Color index per cluster so that adjacent clusters get different colors (DSatur greedy coloring) '''
+    neighbors = {cluster:set() for cluster in clusters}
+    for cluster_a, cluster_b in adjacent_clusters:
+        neighbors[cluster_a].add(cluster_b)
+        neighbors[cluster_b].add(cluster_a)
+    neighbor_colors = {cluster:set() for cluster in clusters}
+    color_per_cluster = {}
+    # color the cluster with the most differently colored neighbors first, then with the highest degree
+    heap = [(0, -len(neighbors[cluster]), cluster) for cluster in clusters]
+    heapq.heapify(heap)
+    while heap:
+        saturation, _, cluster = heapq.heappop(heap)
+        if cluster in color_per_cluster or -saturation != len(neighbor_colors[cluster]):
+            continue # already colored or outdated entry
+        color = 0
+        while color in neighbor_colors[cluster]:
+            color += 1
+        color_per_cluster[cluster] = color
+        for neighbor in neighbors[cluster]:
+            if neighbor not in color_per_cluster and color not in neighbor_colors[neighbor]:
+                neighbor_colors[neighbor].add(color)
+                heapq.heappush(heap, (-len(neighbor_colors[neighbor]), -len(neighbors[neighbor]), neighbor))
+    return color_per_cluster
+
+def get_palette(color_count, color_scheme, seed):
+    ''' Colors with well separated hues (golden ratio steps from a seeded starting hue) '''
+    saturation, value = (0.9, 0.9) if color_scheme == 'primary-colors' else (0.35, 0.98)
+    start_hue = random.Random(seed).random()
+    palette = []
+    for index in range(color_count):
+        red, green, blue = colorsys.hsv_to_rgb((start_hue + index * 0.618033988749895) % 1.0, saturation, value)
+        palette.append('#{:02x}{:02x}{:02x}'.format(int(round(red * 255)), int(round(green * 255)), int(round(blue * 255))))
+    return palette
+
+def color_nodes_in_process(sub_graphs, clusters_per_node_per_graph, color_scheme, seed):
+    ''' Single color per node from the color of its first cluster, adjacent clusters having different colors (replaces gvmap) '''
+    cluster_per_node = {node:clusters[0] for clusters_per_node in clusters_per_node_per_graph for node, clusters in clusters_per_node.items()}
+    clusters = sorted(set(cluster_per_node.values()))
+    adjacent_clusters = get_cluster_adjacency(sub_graphs, cluster_per_node)
+    color_per_cluster = get_dsatur_coloring(clusters, adjacent_clusters)
+    palette = get_palette(max(color_per_cluster.values(), default=-1) + 1, color_scheme, seed)
+    logging.info("Colored %d clusters (%d adjacent pairs) with %d colors", len(clusters), len(adjacent_clusters), len(palette))
+    return {node:palette[color_per_cluster[cluster]] for node, cluster in cluster_per_node.items()}
+
 def get_colors_per_node_global(color_per_node, clusters_per_node_per_graph):
     clusters_per_node = utils.merge_dictionaries(clusters_per_node_per_graph)
 
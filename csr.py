@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+class CSRGraph:
+    '''
+    Compact undirected graph: int32 CSR adjacency (each edge stored in both directions,
+    self-loops once), optional float64 edge weights aligned with the adjacency and columnar
+    NumPy node attributes. Nodes are addressed by their index in node_ids, get_indices
+    converts node ids into indices.
+    '''
+    def __init__(self, node_ids, indptr, indices, weights=None):
+        self.node_ids = node_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.attributes = {}
+        self.sorter = np.argsort(node_ids, kind='stable')
+
+    @classmethod
+    def from_networkx(cls, graphs, attributes={}, weight=None):
+        '''
+        Build a CSR graph from the union of networkx graphs with disjoint node sets, without copying them.
+        attributes maps the node attributes to keep as columns to their (dtype, default value).
+        weight is the edge attribute kept as edge weights (1.0 if missing), no weights are kept if None.
+        '''
+        node_ids = np.array([node for graph in graphs for node in graph.nodes()])
+        degrees = np.fromiter((len(neighbors) for graph in graphs for _, neighbors in graph.adjacency()), dtype=np.int64, count=len(node_ids))
+        indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+        np.cumsum(degrees, out=indptr[1:])
+        csr_graph = cls(node_ids, indptr, None)
+
+        neighbor_ids = np.array([neighbor for graph in graphs for _, neighbors in graph.adjacency() for neighbor in neighbors], dtype=node_ids.dtype)
+        csr_graph.indices = csr_graph.get_indices(neighbor_ids).astype(np.int32)
+        if weight:
+            csr_graph.weights = np.array([data.get(weight, 1.0) for graph in graphs for _, neighbors in graph.adjacency() for data in neighbors.values()], dtype=np.float64)
+
+        for name, (dtype, default) in attributes.items():
+            values = [data.get(name, default) for graph in graphs for _, data in graph.nodes(data=True)]
+            csr_graph.attributes[name] = np.array(values, dtype=dtype)
+        return csr_graph
+
+    def get_indices(self, node_ids):
+        ''' Indices of the given node ids '''
+        return self.sorter[np.searchsorted(self.node_ids, node_ids, sorter=self.sorter)]
+
+    def number_of_nodes(self):
+        return len(self.node_ids)
+
+    def number_of_edges(self):
+        self_loop_count = np.count_nonzero(self.sources() == self.indices)
+        return (len(self.indices) + self_loop_count) // 2
+
+    def sources(self):
+        ''' Source node index of each adjacency entry '''
+        return np.repeat(np.arange(len(self.node_ids), dtype=np.int32), np.diff(self.indptr))
+
+    def partition_views(self, attribute='partition'):
+        ''' One view per value of the given attribute, sharing the graph arrays '''
+        values = self.attributes[attribute]
+        sorted_indices = np.argsort(values, kind='stable')
+        partitions, starts = np.unique(values[sorted_indices], return_index=True)
+        return {partition: PartitionView(self, partition, node_indices)
+                for partition, node_indices in zip(partitions.tolist(), np.split(sorted_indices, starts[1:]))}
+
+class PartitionView:
+    '''
+    Nodes of a CSRGraph belonging to one partition. Node ids and attributes are read
+    from the graph arrays on demand instead of being copied.
+    '''
+    def __init__(self, graph, partition, node_indices):
+        self.graph = graph
+        self.partition = partition
+        self.node_indices = node_indices
+
+    def number_of_nodes(self):
+        return len(self.node_indices)
+
+    def node_ids(self):
+        return self.graph.node_ids[self.node_indices]
+
+    def attribute(self, name):
+        return self.graph.attributes[name][self.node_indices]
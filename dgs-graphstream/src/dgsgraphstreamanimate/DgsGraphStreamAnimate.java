@@ -1,12 +1,33 @@
 package dgsgraphstreamanimate;
 
 import java.io.IOException;
+import java.io.PrintStream;
+import java.io.PrintWriter;
+import java.io.BufferedWriter;
+import java.io.FileWriter;
+import java.io.BufferedReader;
+import java.io.FileReader;
+import java.io.InputStreamReader;
+import java.io.InputStream;
+import java.io.Reader;
+import java.io.File;
+import java.io.FileInputStream;
+import java.io.FileOutputStream;
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.DataInputStream;
+import java.io.DataOutputStream;
+import java.util.zip.GZIPInputStream;
+import java.util.zip.GZIPOutputStream;
 import java.util.ArrayList;
 import java.util.Arrays;
 import java.util.HashMap;
+import java.util.LinkedHashSet;
 import java.util.List;
 import java.util.Map;
+import java.util.Set;
 import java.util.Iterator;
+import java.util.Locale;
 import java.util.Random;
 import java.lang.reflect.Field;
 import java.lang.Math;
@@ -57,10 +78,24 @@ public class DgsGraphStreamAnimate extends SinkAdapter {
     private Map<String, Integer> nodeFrameStart; // Frame id per node
     private Map<String, Integer> nodeFrameCount; // Frame count per node (number of frames to generate when a given node is added)
     private List<String> addedNodes; // List of nodes that have been added so far
+    private Set<String> highlightedNodes; // Nodes currently highlighted
     private int highlightedFrameCount; // Number of frames during which a node is highlighted
     private int highlightSizeMin; // Min size multiplier for highlighted nodes
     private int highlightSizeMax; // Max size multiplier for highlighted nodes
     private int cutEdgeLength; // Length of cut edges
+    private DataOutputStream trajectoryWriter; // Node positions per frame recorded during the layout pass (dot mode)
+    private DataInputStream trajectoryReader; // Node positions per frame replayed instead of computing the layout (images mode)
+    private Boolean renderPng; // Export png frames (images mode)
+    private Boolean renderSvg; // Export svg keyframes (images mode)
+    private int svgInterval; // Number of frames between 2 svg keyframes
+    private int svgOffset; // Index of the first svg keyframe
+    private int renderedFrameCount; // Number of frames rendered so far
+    private Boolean adaptiveLayout; // Iterate the layout until it is stable enough or the step time budget is spent
+    private double stabilizationThreshold; // Layout stabilization (0 to 1) at which layout iterations stop
+    private long stepTime; // Layout time budget per frame in milliseconds
+    private int maxIterations; // Maximum number of layout iterations per frame
+    private PrintWriter metricsWriter; // Per-frame metrics (CSV), null if disabled
+    private FrameRenderPool renderPool; // Threads rendering the frames from snapshots (images mode), null to render on the layout thread
 
     private enum LayoutType {
         LinLog,
@@ -77,9 +112,11 @@ public class DgsGraphStreamAnimate extends SinkAdapter {
         HighlightNew
     }
 
-    private void AnimateDgs(String inputDGS, String outputDirectory, LayoutType layout_type, Mode mode, String outputDotFilepath,
+    private void AnimateDgs(String inputDGS, String outputDirectory, LayoutType layout_type, Mode mode, String outputDotFilepath, String outputPositionsFilepath,
                             long seed, float force, float a, float r, float theta,
-                            NodeSizeMode nodeSizeMode, String shadowColor, int edgeSize, int labelSize, int width, int height, int cutEdgeLength, Boolean display)
+                            NodeSizeMode nodeSizeMode, String shadowColor, int edgeSize, int labelSize, int width, int height, int cutEdgeLength,
+                            String trajectoryFilepath, List<String> formats, int svgInterval, int svgOffset,
+                            double stabilizationThreshold, long stepTime, int maxIterations, String metricsFilepath, int renderThreads, Boolean display)
             throws java.io.IOException {
 
         System.setProperty("org.graphstream.ui.renderer","org.graphstream.ui.j2dviewer.J2DGraphRenderer");
@@ -102,26 +139,56 @@ public class DgsGraphStreamAnimate extends SinkAdapter {
         this.nodeFrameStart = new HashMap<String, Integer>();
         this.nodeFrameCount = new HashMap<String, Integer>();
         this.addedNodes = new ArrayList<String>();
+        this.highlightedNodes = new LinkedHashSet<String>();
         this.highlightedFrameCount = 4;
         this.highlightSizeMin = 1;
         this.highlightSizeMax = 3;
         this.cutEdgeLength = cutEdgeLength;
-
+        this.trajectoryWriter = null;
+        this.trajectoryReader = null;
+        this.renderPng = formats.contains("png");
+        this.renderSvg = formats.contains("svg");
+        this.svgInterval = svgInterval;
+        this.svgOffset = svgOffset;
+        this.renderedFrameCount = 0;
+        this.adaptiveLayout = stabilizationThreshold > 0 || stepTime > 0;
+        this.stabilizationThreshold = stabilizationThreshold;
+        this.stepTime = stepTime;
+        this.maxIterations = maxIterations;
+        this.metricsWriter = null;
+        if (metricsFilepath != null) {
+            this.metricsWriter = new PrintWriter(new BufferedWriter(new FileWriter(metricsFilepath)));
+            this.metricsWriter.println("frame,nodes,edges,layout_iterations,stabilization,highlight_ns,layout_ns,cut_edges_ns,snapshot_ns,svg_ns,png_ns");
+        }
+        this.renderPool = null;
+        if (trajectoryFilepath != null) {
+            if (mode == Mode.DotFile) {
+                this.trajectoryWriter = new DataOutputStream(new BufferedOutputStream(new GZIPOutputStream(new FileOutputStream(trajectoryFilepath))));
+            } else if (new File(trajectoryFilepath).isFile()) { // fall back to computing the layout if no trajectory was recorded
+                this.trajectoryReader = new DataInputStream(new BufferedInputStream(new GZIPInputStream(new FileInputStream(trajectoryFilepath))));
+            }
+        }
 
         layout = CreateLayout(layout_type, seed, force, a, r, theta);
 
+        // fsi only holds the GraphicGraph and renderer used by takeScreenshot, it does not output images by itself
         fsi = new FileSinkImages("frame_", OutputType.PNG, new CustomResolution(width, height), OutputPolicy.NONE);
-        fsi.setOutputPolicy(OutputPolicy.BY_STEP);
         fsi.setLayoutPolicy(LayoutPolicy.NO_LAYOUT);
         fsi.setQuality(Quality.HIGH);
         fsi.setRenderer(RendererType.SCALA);
         fsi.setStyleSheet(styleSheet);
 
-        // chain: dgs -> g -> layout -> fsi
-        dgs.addSink(this.g);
-        this.g.addSink(layout);
-        layout.addAttributeSink(this.g);
-        layout.addSink(fsi);
+        if (this.trajectoryReader != null) {
+            // chain: dgs -> g -> fsi (node positions are replayed from the trajectory file)
+            dgs.addSink(this.g);
+            this.g.addSink(fsi);
+        } else {
+            // chain: dgs -> g -> layout -> fsi
+            dgs.addSink(this.g);
+            this.g.addSink(layout);
+            layout.addAttributeSink(this.g);
+            layout.addSink(fsi);
+        }
 
         dgs.addSink(this);
 
@@ -129,18 +196,26 @@ public class DgsGraphStreamAnimate extends SinkAdapter {
 
         if (display) {
             viewer = this.g.display();
-            viewer.enableAutoLayout(layout);
+            if (this.trajectoryReader == null) {
+                viewer.enableAutoLayout(layout);
+            }
             //pipe = viewer.newViewerPipe();
             pipe = viewer.newThreadProxyOnGraphicGraph();
         }
 
         if (mode == Mode.Images) {
             fsi.begin(outputDirectory);
+            // The viewer renders on the Swing thread with the same font and image caches, without the lock of the pool
+            if (renderThreads > 1 && !display) {
+                this.renderPool = new FrameRenderPool(renderThreads, styleSheet, width, height, this.metricsWriter);
+            }
             try {
-                dgs.begin(inputDGS);
+                dgs.begin(openDgsReader(inputDGS));
                 while (dgs.nextEvents()) {
 
-                    layout.compute();
+                    if (this.trajectoryReader == null && !this.adaptiveLayout) {
+                        layout.compute();
+                    }
 
                     if (display) {
                         pipe.pump();
@@ -148,31 +223,63 @@ public class DgsGraphStreamAnimate extends SinkAdapter {
                 }
                 dgs.end();
                 fsi.end();
+                if (this.trajectoryReader != null) {
+                    this.trajectoryReader.close();
+                }
+                if (this.renderPool != null) {
+                    this.renderPool.close(); // wait for the last frames to be rendered
+                }
             } catch (IOException e1) {
-                e1.printStackTrace();
-                System.exit(1);
+                throw new RuntimeException(e1);
+            } finally {
+                if (this.renderPool != null) {
+                    this.renderPool.shutdown();
+                }
             }
         } else { // DotFile
             try {
-                dgs.begin(inputDGS);
+                dgs.begin(openDgsReader(inputDGS));
                 while (dgs.nextEvents()) {
-                    layout.compute();
+                    if (!this.adaptiveLayout) { // the adaptive layout only iterates once per frame
+                        layout.compute();
+                    }
                 }
                 fsi.begin(outputDirectory); // Get last layout to propagate to fsi without generating any image file
                 fsi.end();
                 dgs.end();
+                if (this.trajectoryWriter != null) {
+                    this.trajectoryWriter.close();
+                }
             } catch (IOException e1) {
-                e1.printStackTrace();
-                System.exit(1);
+                throw new RuntimeException(e1);
             }
 
             try {
                 exportGraphAsDotFile(this.g, getGraphicGraph(fsi), outputDotFilepath);
+                if (outputPositionsFilepath != null) {
+                    exportPositions(this.g, getGraphicGraph(fsi), outputPositionsFilepath);
+                }
             } catch (Exception e) {
-                e.printStackTrace();
-                System.exit(1);
+                throw new RuntimeException(e);
             }
         }
+
+        if (this.metricsWriter != null) {
+            this.metricsWriter.close();
+        }
+    }
+
+    /**
+     * Open a DGS file, gzip-compressed DGS file or FIFO. The gzip magic number is read through a buffered stream
+     * because FileSourceDGS detects gzip by reopening the file, which loses the data already read from a FIFO.
+     */
+    private static Reader openDgsReader(String filepath) throws IOException {
+        BufferedInputStream stream = new BufferedInputStream(new FileInputStream(filepath));
+        stream.mark(2);
+        int magic = stream.read() | (stream.read() << 8);
+        stream.reset();
+        InputStream input = (magic == GZIPInputStream.GZIP_MAGIC) ? new GZIPInputStream(stream) : stream;
+        return new BufferedReader(new InputStreamReader(input));
     }
 
     private String CreateStyleSheet(String shadowColor) {
@@ -225,8 +332,7 @@ public class DgsGraphStreamAnimate extends SinkAdapter {
                 SetLayoutVariable(layout, "K1", a); // attraction
                 SetLayoutVariable(layout, "K2", r); // repulsion
             } catch (Exception e) {
-                e.printStackTrace();
-                System.exit(1);
+                throw new RuntimeException(e);
             }
             
             return layout;
@@ -255,6 +361,23 @@ public class DgsGraphStreamAnimate extends SinkAdapter {
         dot_sink.writeAll(graph, outputFilePath);
     }
 
+    /**
+     * Export node positions (scaled as in the dot file) as big-endian (long node id, double x, double y) records
+     */
+    private void exportPositions(DefaultGraph graph, GraphicGraph graphicGraph, String outputFilePath) throws IOException {
+        DataOutputStream positionsWriter = new DataOutputStream(new BufferedOutputStream(new FileOutputStream(outputFilePath)));
+        try {
+            for (Node node : graph) {
+                GraphicNode graphics_graph_node = graphicGraph.getNode(node.getId());
+                positionsWriter.writeLong(Long.parseLong(node.getId()));
+                positionsWriter.writeDouble(graphics_graph_node.x*100);
+                positionsWriter.writeDouble(graphics_graph_node.y*100);
+            }
+        } finally {
+            positionsWriter.close();
+        }
+    }
+
     /**
      * Get GraphicGraph instance from FileSinkImages (only place where to get a node's position)
      */
@@ -337,15 +460,26 @@ public class DgsGraphStreamAnimate extends SinkAdapter {
         e.setAttribute("ui.size", this.edgeSize);
     }
 
+    private String getFrameFilepath(int step, String extension) {
+        return outputDirectory + String.format("%06d_new", step) + "." + extension;
+    }
+
     private void takeScreenshot(int step, String extension) {
         try {
-            getGraphRenderer(fsi).screenshot(outputDirectory + String.format("%06d_new", step) + "." + extension, width, height);
+            DrawingOrder.sort(getGraphicGraph(fsi)); // same drawing order as the render threads
+            getGraphRenderer(fsi).screenshot(getFrameFilepath(step, extension), width, height);
         } catch (Exception e1) {
-            e1.printStackTrace();
-            System.exit(1);
+            throw new RuntimeException(e1);
         }
     }
 
+    /**
+     * Whether the current frame is a svg keyframe (every svgInterval frames starting from frame svgOffset)
+     */
+    private Boolean isSvgKeyframe() {
+        return this.renderedFrameCount >= this.svgOffset && (this.renderedFrameCount - this.svgOffset) % this.svgInterval == 0;
+    }
+
     private void setEdgeLength(GraphicEdge edge, double length) throws NoSuchFieldException, IllegalAccessException {
         GraphicNode source = edge.getSourceNode();
         GraphicNode target = edge.getTargetNode();
@@ -361,6 +495,38 @@ public class DgsGraphStreamAnimate extends SinkAdapter {
         target.move(nx, ny, target.getZ());
     }
 
+    /**
+     * Append the position of every added node (in order of addition) to the trajectory file
+     */
+    private void writeTrajectoryFrame() throws IOException, NoSuchFieldException, IllegalAccessException {
+        GraphicGraph graphicGraph = getGraphicGraph(fsi);
+        this.trajectoryWriter.writeInt(this.addedNodes.size());
+        for (String nodeId : this.addedNodes) {
+            GraphicNode node = graphicGraph.getNode(nodeId);
+            this.trajectoryWriter.writeFloat(node != null ? (float)node.getX() : Float.NaN);
+            this.trajectoryWriter.writeFloat(node != null ? (float)node.getY() : Float.NaN);
+        }
+    }
+
+    /**
+     * Read the next frame from the trajectory file and move the added nodes to their recorded positions
+     */
+    private void readTrajectoryFrame() throws IOException, NoSuchFieldException, IllegalAccessException {
+        GraphicGraph graphicGraph = getGraphicGraph(fsi);
+        int count = this.trajectoryReader.readInt();
+        if (count != this.addedNodes.size()) {
+            throw new IOException(String.format("Trajectory frame contains %d nodes, expected %d", count, this.addedNodes.size()));
+        }
+        for (int i = 0; i < count; i++) {
+            float x = this.trajectoryReader.readFloat();
+            float y = this.trajectoryReader.readFloat();
+            GraphicNode node = graphicGraph.getNode(this.addedNodes.get(i));
+            if (node != null && !Float.isNaN(x)) {
+                node.move(x, y, node.getZ());
+            }
+        }
+    }
+
     private void changeCutEdgesLength() {
         try {
             GraphicGraph graphicGraph = getGraphicGraph(fsi);
@@ -376,11 +542,67 @@ public class DgsGraphStreamAnimate extends SinkAdapter {
                 }
             }
         } catch (Exception e) {
-            e.printStackTrace();
-            System.exit(1);
+            throw new RuntimeException(e);
         }
     }
 
+    /**
+     * Highlight the nodes added during the last highlightedFrameCount frames (several nodes can be added at each step)
+     * and reset the nodes which are no longer highlighted
+     */
+    private void highlightNewNodes(int lastNodeFrameStart, int c) {
+        // Reset nodes no longer highlighted
+        Iterator<String> iN = this.highlightedNodes.iterator();
+        while (iN.hasNext()) {
+            Node node = this.g.getNode(iN.next());
+            int frameOffset = lastNodeFrameStart - this.nodeFrameStart.get(node.getId()) + c; // frame offset
+            if (frameOffset >= this.highlightedFrameCount - 1) {
+                node.setAttribute("ui.size", this.nodeSize.get(node.getId())); // reset size to normal size
+                node.removeAttribute("ui.class"); // remove shadow
+                iN.remove();
+            }
+        }
+        // Highlight the most recent nodes, going back from the last added node
+        for (int i = this.addedNodes.size() - 1; i >= 0; i--) {
+            Node node = this.g.getNode(this.addedNodes.get(i)); // get current node to be highlighted
+            int frameStart = this.nodeFrameStart.get(node.getId());
+            int frameOffset = lastNodeFrameStart - frameStart + c; // frame offset
+            if (frameOffset >= this.highlightedFrameCount - 1) {
+                break; // older nodes are no longer highlighted
+            }
+            if (!node.hasAttribute("hidden")) {// do not highlight hidden nodes
+                // Node size
+                int size = this.nodeSize.get(node.getId());
+                float multiplier = this.highlightSizeMin + ((float)(this.highlightedFrameCount - frameOffset) / (this.highlightedFrameCount)) * (this.highlightSizeMax - this.highlightSizeMin);
+                node.setAttribute("ui.size", (int)(size * multiplier)); // set highlighted size
+                // Node shadow
+                node.setAttribute("ui.class", "shadow"); // add shadow
+                this.highlightedNodes.add(node.getId());
+            }
+        }
+    }
+
+    /**
+     * Compute the layout of a frame and return the number of iterations. In adaptive mode, iterate until the layout
+     * stabilization reaches stabilizationThreshold, the stepTime budget is spent or maxIterations is reached
+     * (no iteration if the layout is already stable), otherwise run a single iteration.
+     */
+    private int computeLayout() {
+        if (!this.adaptiveLayout) {
+            layout.compute();
+            return 1;
+        }
+        long deadline = System.nanoTime() + this.stepTime * 1000000L;
+        int iterations = 0;
+        while (iterations < this.maxIterations
+               && (this.stabilizationThreshold <= 0 || layout.getStabilization() < this.stabilizationThreshold)
+               && (this.stepTime <= 0 || System.nanoTime() < deadline)) {
+            layout.compute();
+            iterations++;
+        }
+        return iterations;
+    }
+
     public void stepBegins(String sourceId, long timeId, double step) {
         int lastNodeId = this.addedNodes.size() - 1;
         Node lastNode = this.g.getNode(this.addedNodes.get(lastNodeId)); // get last added node n
@@ -388,59 +610,95 @@ public class DgsGraphStreamAnimate extends SinkAdapter {
         int lastNodeFrameCount = this.nodeFrameCount.get(lastNode.getId()); // number of frames to produce
 
         int frameIndex = lastNodeFrameStart;
+        int stepIterations = 0;
         for (int c = 0; c < lastNodeFrameCount; c++) { // iterates over the number of frames to be generated
+            long highlightTime = 0, layoutTime = 0, cutEdgesTime = 0, snapshotTime = 0, svgTime = 0, pngTime = 0; // nanoseconds spent in each part of the frame
+            int frameIterations = 0;
+            long start = System.nanoTime();
             if (this.nodeSizeMode == NodeSizeMode.HighlightNew) {
-                for (int i = 0; i < this.highlightedFrameCount; i++) { // iterates over the maximum number of nodes to be highlighted
-                    if (i < this.addedNodes.size()) {
-                        Node node = this.g.getNode(this.addedNodes.get(this.addedNodes.size() - i - 1));  // get current node n-i to be highlighted
-                        int frameStart = this.nodeFrameStart.get(node.getId());
-                        int frameOffset = lastNodeFrameStart - frameStart + c; // frame offset
-
-                        if (!node.hasAttribute("hidden")) {// do not highlight hidden nodes
-                            // Node size
-                            int size = this.nodeSize.get(node.getId());
-                            if (frameOffset < this.highlightedFrameCount - 1) {
-                                float multiplier = this.highlightSizeMin + ((float)(this.highlightedFrameCount - frameOffset) / (this.highlightedFrameCount)) * (this.highlightSizeMax - this.highlightSizeMin);
-                                node.setAttribute("ui.size", (int)(size * multiplier)); // set highlighted size
-                            } else {
-                                node.setAttribute("ui.size", size); // reset size to normal size (node no longer highlighted)
-                            }
-                            // Node shadow
-                            if (frameOffset < this.highlightedFrameCount - 1) {
-                                node.setAttribute("ui.class", "shadow"); // add shadow
-                            } else {
-                                node.removeAttribute("ui.class"); // remove shadow (node no longer highlighted)
-                            }
-                        }
-                    }
-                }
+                highlightNewNodes(lastNodeFrameStart, c);
             }
+            highlightTime = System.nanoTime() - start;
 
-            layout.compute(); // recompute layout
+            try {
+                start = System.nanoTime();
+                if (this.trajectoryReader != null) {
+                    readTrajectoryFrame(); // replay positions (cut edges included) recorded during the layout pass
+                    layoutTime = System.nanoTime() - start;
+                } else {
+                    frameIterations = computeLayout(); // recompute layout
+                    stepIterations += frameIterations;
+                    layoutTime = System.nanoTime() - start;
+
+                    start = System.nanoTime();
+                    if (this.cutEdgeLength > 0)
+                        changeCutEdgesLength();
+                    cutEdgesTime = System.nanoTime() - start;
+                }
 
-            if (this.cutEdgeLength > 0)
-                changeCutEdgesLength();
+                if (this.trajectoryWriter != null) {
+                    writeTrajectoryFrame(); // record positions for the images pass
+                }
+            } catch (Exception e) {
+                throw new RuntimeException(e);
+            }
 
+            FrameRenderPool.FrameSnapshot snapshot = null;
             if (mode == Mode.Images) {
-                takeScreenshot(frameIndex, "svg"); // export svg file
-                takeScreenshot(frameIndex, "png"); // export png file
+                Boolean svgKeyframe = this.renderSvg && isSvgKeyframe();
+                if (this.renderPool != null) {
+                    // snapshot the frame, rendered by the pool while the layout of the next frames is computed
+                    start = System.nanoTime();
+                    try {
+                        snapshot = FrameRenderPool.FrameSnapshot.capture(getGraphicGraph(fsi), svgKeyframe ? getFrameFilepath(frameIndex, "svg") : null,
+                                                                         this.renderPng ? getFrameFilepath(frameIndex, "png") : null);
+                    } catch (Exception e) {
+                        throw new RuntimeException(e);
+                    }
+                    snapshotTime = System.nanoTime() - start;
+                } else {
+                    if (svgKeyframe) {
+                        start = System.nanoTime();
+                        takeScreenshot(frameIndex, "svg"); // export svg file
+                        svgTime = System.nanoTime() - start;
+                    }
+                    if (this.renderPng) {
+                        start = System.nanoTime();
+                        takeScreenshot(frameIndex, "png"); // export png file
+                        pngTime = System.nanoTime() - start;
+                    }
+                }
+                this.renderedFrameCount++;
+            }
+
+            String metrics = null;
+            if (this.metricsWriter != null) {
+                String stabilization = this.trajectoryReader == null ? String.format(Locale.ROOT, "%.4f", layout.getStabilization()) : ""; // no layout when replaying
+                metrics = String.format(Locale.ROOT, "%d,%d,%d,%d,%s,%d,%d,%d,%d", frameIndex, this.g.getNodeCount(), this.g.getEdgeCount(),
+                                        frameIterations, stabilization, highlightTime, layoutTime, cutEdgesTime, snapshotTime);
+            }
+            if (snapshot != null) {
+                this.renderPool.submit(snapshot, metrics); // the render timings are added to the metrics once the frame is rendered
+            } else if (metrics != null) {
+                this.metricsWriter.println(metrics + String.format(Locale.ROOT, ",%d,%d", svgTime, pngTime));
             }
             frameIndex++;
         }
-	}
 
-    public static void main(String[] args) {
+        if (this.adaptiveLayout && this.trajectoryReader == null) {
+            System.out.println(String.format("#layout step %d iterations %d stabilization %.3f", (int)step, stepIterations, layout.getStabilization()));
+        }
+	}
 
+    /**
+     * Parse command line options into a map of option values (null on illegal usage)
+     */
+    private static Map<String, List<String>> parseArguments(String[] args) {
         Map<String, List<String>> params = new HashMap<>();
         List<String> options = null;
 
         for (String a : args) {
-            if (a.charAt(0) == '-' && Character.isLetter(a.charAt(1))) {
-                if (a.length() < 2) {
-                    System.err.println("Error at argument " + a);
-                    return;
-                }
-
+            if (a.length() > 1 && a.charAt(0) == '-' && Character.isLetter(a.charAt(1))) { // "-" alone is a value (stdin)
                 options = new ArrayList<>();
                 params.put(a.substring(1), options);
             }
@@ -449,10 +707,17 @@ public class DgsGraphStreamAnimate extends SinkAdapter {
             }
             else {
                 System.err.println("Illegal parameter usage");
-                return;
+                return null;
             }
         }
 
+        return params;
+    }
+
+    /**
+     * Check the required options of a job and print the usage if any is missing
+     */
+    private static Boolean validateArguments(Map<String, List<String>> params) {
         Boolean error = false;
         if (!params.containsKey("dgs")) {
             System.out.println("Missing required option: -dgs\n");
@@ -464,7 +729,7 @@ public class DgsGraphStreamAnimate extends SinkAdapter {
         }
         if (error || params.containsKey("help") || params.containsKey("h")) {
             System.out.println("usage: DgsGraphStreamAnimate.jar [OPTIONS]...");
-            System.out.println("-dgs <arg>              input GraphStream DGS file");
+            System.out.println("-dgs <arg>              input GraphStream DGS file (plain or gzip-compressed file, or FIFO)");
             System.out.println("-out <arg>              frame filenames are prepended with this path");
             System.out.println("-layout <arg>           layout type to use. options: [springbox|linlog]. default: springbox");
             System.out.println("-seed <arg>             random seed for the layout");
@@ -479,11 +744,29 @@ public class DgsGraphStreamAnimate extends SinkAdapter {
             System.out.println("-cut_edge_length <arg>  cut edge length");
             System.out.println("-mode <arg>             mode. options: [images|dot]. default: images");
             System.out.println("-dotfile <arg>          output dot file");
+            System.out.println("-positions <arg>        output node positions file (binary id, x, y records) in dot mode");
+            System.out.println("-trajectory <arg>       node positions per frame. written in dot mode, replayed in images mode");
+            System.out.println("-formats <arg>          comma-separated image formats to export in images mode. options: [png,svg]. default: png,svg");
+            System.out.println("-svg_interval <arg>     number of frames between 2 svg keyframes. default: 1");
+            System.out.println("-svg_offset <arg>       index of the first svg keyframe. default: 0");
+            System.out.println("-stabilization <arg>    adaptive layout: iterate until this stabilization (0 to 1) is reached");
+            System.out.println("-step_time <arg>        adaptive layout: layout time budget per frame in milliseconds");
+            System.out.println("-max_iterations <arg>   adaptive layout: maximum number of layout iterations per frame. default: 100");
+            System.out.println("-metrics <arg>          write per-frame metrics (node and edge counts, layout stabilization, timings in nanoseconds) to this CSV file");
+            System.out.println("-render_threads <arg>   number of threads rendering the frames in images mode while the next frames are laid out. default: 1 (rendered on the layout thread, also with -display)");
             System.out.println("-display screen         layout option to use. options: [screen]");
+            System.out.println("-log <arg>              redirect the job output to this file");
+            System.out.println("-batch <arg>            run the jobs listed in this manifest file (or stdin if '-'), one job per line with tab-separated options");
             System.out.println("-h,-help                display this help and exit");
-            System.exit(1);
+            return false;
         }
+        return true;
+    }
 
+    /**
+     * Run a single job (one DGS file in one mode) from its options
+     */
+    private static void runJob(Map<String, List<String>> params) throws IOException {
         LayoutType layout_type = LayoutType.SpringBox;
         if (params.containsKey("layout") && params.get("layout").get(0).equals("linlog")) {
             layout_type = LayoutType.LinLog;
@@ -545,14 +828,141 @@ public class DgsGraphStreamAnimate extends SinkAdapter {
             cutEdgeLength = Integer.parseInt(params.get("cut_edge_length").get(0));
         }
 
+        String positionsFilepath = null;
+        if (params.containsKey("positions")) {
+            positionsFilepath = params.get("positions").get(0);
+        }
+
+        String trajectoryFilepath = null;
+        if (params.containsKey("trajectory")) {
+            trajectoryFilepath = params.get("trajectory").get(0);
+        }
+
+        List<String> formats = Arrays.asList("png", "svg");
+        if (params.containsKey("formats")) {
+            formats = Arrays.asList(params.get("formats").get(0).split(","));
+        }
+        int svgInterval = 1; // default: every frame is a svg keyframe
+        if (params.containsKey("svg_interval")) {
+            svgInterval = Integer.parseInt(params.get("svg_interval").get(0));
+        }
+        int svgOffset = 0;
+        if (params.containsKey("svg_offset")) {
+            svgOffset = Integer.parseInt(params.get("svg_offset").get(0));
+        }
+
+        double stabilizationThreshold = 0; // default: one layout iteration per frame
+        if (params.containsKey("stabilization")) {
+            stabilizationThreshold = Double.parseDouble(params.get("stabilization").get(0));
+        }
+        long stepTime = 0;
+        if (params.containsKey("step_time")) {
+            stepTime = Long.parseLong(params.get("step_time").get(0));
+        }
+        int maxIterations = 100;
+        if (params.containsKey("max_iterations")) {
+            maxIterations = Integer.parseInt(params.get("max_iterations").get(0));
+        }
+
+        String metricsFilepath = null;
+        if (params.containsKey("metrics")) {
+            metricsFilepath = params.get("metrics").get(0);
+        }
+        int renderThreads = 1;
+        if (params.containsKey("render_threads")) {
+            renderThreads = Integer.parseInt(params.get("render_threads").get(0));
+        }
+
+        System.out.println(params.get("dgs").get(0));
+        DgsGraphStreamAnimate dgs = new DgsGraphStreamAnimate();
+
+        dgs.AnimateDgs(params.get("dgs").get(0), params.get("out").get(0), layout_type, mode, params.get("dotfile").get(0), positionsFilepath,
+                       seed, force, a, r, theta, nodeSizeMode, shadowColor ,edgeSize, labelSize, width, height, cutEdgeLength, trajectoryFilepath, formats, svgInterval, svgOffset,
+                       stabilizationThreshold, stepTime, maxIterations, metricsFilepath, renderThreads, display);
+    }
+
+    /**
+     * Run a single job, redirecting its output to the -log file if given
+     */
+    private static void runJobWithLog(Map<String, List<String>> params) throws IOException {
+        if (!params.containsKey("log")) {
+            runJob(params);
+            return;
+        }
+        PrintStream stdout = System.out;
+        PrintStream stderr = System.err;
+        PrintStream log = new PrintStream(new FileOutputStream(params.get("log").get(0)), true);
+        System.setOut(log);
+        System.setErr(log);
         try {
-            System.out.println(params.get("dgs").get(0));
-            DgsGraphStreamAnimate dgs = new DgsGraphStreamAnimate();
+            runJob(params);
+        } catch (IOException | RuntimeException e) {
+            e.printStackTrace(); // report the failure in the job log
+            throw e;
+        } finally {
+            System.setOut(stdout);
+            System.setErr(stderr);
+            log.close();
+        }
+    }
 
-            dgs.AnimateDgs(params.get("dgs").get(0), params.get("out").get(0), layout_type, mode, params.get("dotfile").get(0),
-                           seed, force, a, r, theta, nodeSizeMode, shadowColor ,edgeSize, labelSize, width, height, cutEdgeLength, display);
-        } catch(IOException e) {
+    /**
+     * Run the jobs listed in a manifest file (or stdin if "-") in this JVM, one job per line with tab-separated options.
+     * A "#job <index> ok|failed" line is printed on stdout when each job completes so that callers can stream jobs.
+     */
+    private static Boolean runBatch(String manifest) throws IOException {
+        BufferedReader reader = manifest.equals("-") ? new BufferedReader(new InputStreamReader(System.in))
+                                                     : new BufferedReader(new FileReader(manifest));
+        PrintStream protocol = System.out;
+        Boolean success = true;
+        int index = 0;
+        String line;
+        while ((line = reader.readLine()) != null) {
+            if (line.trim().isEmpty()) {
+                continue;
+            }
+            Map<String, List<String>> params = parseArguments(line.split("\t"));
+            Boolean ok = params != null && validateArguments(params);
+            if (ok) {
+                try {
+                    runJobWithLog(params);
+                } catch (Exception e) {
+                    ok = false;
+                }
+            }
+            protocol.println(String.format("#job %d %s", index, ok ? "ok" : "failed"));
+            protocol.flush();
+            success &= ok;
+            index++;
+        }
+        reader.close();
+        return success;
+    }
+
+    public static void main(String[] args) {
+        Map<String, List<String>> params = parseArguments(args);
+        if (params == null) {
+            return;
+        }
+
+        if (params.containsKey("batch")) {
+            try {
+                System.exit(runBatch(params.get("batch").get(0)) ? 0 : 1);
+            } catch (IOException e) {
+                e.printStackTrace();
+                System.exit(1);
+            }
+        }
+
+        if (!validateArguments(params)) {
+            System.exit(1);
+        }
+
+        try {
+            runJobWithLog(params);
+        } catch (Exception e) {
             e.printStackTrace();
+            System.exit(1);
         }
     }
 }
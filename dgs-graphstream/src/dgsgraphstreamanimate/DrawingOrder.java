@@ -0,0 +1,126 @@
+package dgsgraphstreamanimate;
+
+import java.lang.reflect.Field;
+import java.util.ArrayList;
+import java.util.HashMap;
+import java.util.HashSet;
+import java.util.Iterator;
+import java.util.LinkedHashMap;
+import java.util.LinkedHashSet;
+import java.util.TreeMap;
+import org.graphstream.graph.Element;
+import org.graphstream.ui.graphicGraph.GraphicGraph;
+import org.graphstream.ui.graphicGraph.StyleGroup;
+import org.graphstream.ui.graphicGraph.StyleGroupSet;
+
+/**
+ * Deterministic drawing order of the elements of a GraphicGraph.
+ *
+ * The J2D renderer draws the style groups of each z-index (and the groups casting shadows) in the iteration order of
+ * hash sets of StyleGroup, i.e. by identity hash code, and the elements of each group in the iteration order of hash
+ * maps whose layout depends on the past sizes of the group. Overlapping nodes and labels are thus drawn in a different
+ * order from one run to the next, and by two GraphicGraphs holding the same elements (the render threads and the
+ * layout thread). Before rendering a frame, these sets and maps are replaced by linked ones sorted by id.
+ */
+public class DrawingOrder {
+
+    private static final Field SHADOW_SET = getField(StyleGroupSet.ShadowSet.class, "shadowSet");
+    private static final Field ELEMENTS = getField(StyleGroup.class, "elements");
+    private static final Field DYNAMIC_ELEMENTS = getField(StyleGroup.class, "dynamicOnes");
+    private static final Field ELEMENT_EVENTS = getField(StyleGroup.class, "eventsFor");
+
+    /**
+     * Sort the style groups and the elements of each group by id, only the unsorted sets and maps are copied
+     */
+    @SuppressWarnings("unchecked")
+    public static void sort(GraphicGraph graph) {
+        StyleGroupSet groups = graph.getStyleGroups();
+        try {
+            ArrayList<HashSet<StyleGroup>> zIndex = groups.getZIndex().zIndex;
+            for (int z = 0; z < zIndex.size(); z++) {
+                if (zIndex.get(z) != null && !isSortedGroups(zIndex.get(z))) {
+                    zIndex.set(z, sortGroups(zIndex.get(z)));
+                }
+            }
+            HashSet<StyleGroup> shadows = (HashSet<StyleGroup>)SHADOW_SET.get(groups.shadows());
+            if (!isSortedGroups(shadows)) {
+                SHADOW_SET.set(groups.shadows(), sortGroups(shadows));
+            }
+
+            for (StyleGroup group : groups.groups()) {
+                HashMap<String, Element> elements = (HashMap<String, Element>)ELEMENTS.get(group);
+                if (!isSortedIds(elements.keySet().iterator())) {
+                    ELEMENTS.set(group, new LinkedHashMap<String, Element>(new TreeMap<String, Element>(elements)));
+                }
+                HashSet<Element> dynamicElements = (HashSet<Element>)DYNAMIC_ELEMENTS.get(group); // null if none
+                if (dynamicElements != null && !isSortedElements(dynamicElements)) {
+                    DYNAMIC_ELEMENTS.set(group, sortElements(dynamicElements));
+                }
+                HashMap<Element, Object> elementEvents = (HashMap<Element, Object>)ELEMENT_EVENTS.get(group); // null if none
+                if (elementEvents != null && !isSortedElements(elementEvents.keySet())) {
+                    LinkedHashMap<Element, Object> sortedEvents = new LinkedHashMap<Element, Object>();
+                    for (Element element : sortElements(elementEvents.keySet())) {
+                        sortedEvents.put(element, elementEvents.get(element));
+                    }
+                    ELEMENT_EVENTS.set(group, sortedEvents);
+                }
+            }
+        } catch (IllegalAccessException e) {
+            throw new RuntimeException(e);
+        }
+    }
+
+    private static Boolean isSortedIds(Iterator<String> ids) {
+        String previous = null;
+        while (ids.hasNext()) {
+            String id = ids.next();
+            if (previous != null && previous.compareTo(id) > 0) {
+                return false;
+            }
+            previous = id;
+        }
+        return true;
+    }
+
+    private static Boolean isSortedGroups(Iterable<StyleGroup> groups) {
+        ArrayList<String> ids = new ArrayList<String>();
+        for (StyleGroup group : groups) {
+            ids.add(group.getId());
+        }
+        return isSortedIds(ids.iterator());
+    }
+
+    private static Boolean isSortedElements(Iterable<Element> elements) {
+        ArrayList<String> ids = new ArrayList<String>();
+        for (Element element : elements) {
+            ids.add(element.getId());
+        }
+        return isSortedIds(ids.iterator());
+    }
+
+    private static LinkedHashSet<StyleGroup> sortGroups(Iterable<StyleGroup> groups) {
+        TreeMap<String, StyleGroup> groupsById = new TreeMap<String, StyleGroup>();
+        for (StyleGroup group : groups) {
+            groupsById.put(group.getId(), group);
+        }
+        return new LinkedHashSet<StyleGroup>(groupsById.values());
+    }
+
+    private static LinkedHashSet<Element> sortElements(Iterable<Element> elements) {
+        TreeMap<String, Element> elementsById = new TreeMap<String, Element>();
+        for (Element element : elements) {
+            elementsById.put(element.getId(), element);
+        }
+        return new LinkedHashSet<Element>(elementsById.values());
+    }
+
+    private static Field getField(Class<?> clazz, String fieldName) {
+        try {
+            Field field = clazz.getDeclaredField(fieldName);
+            field.setAccessible(true);
+            return field;
+        } catch (NoSuchFieldException e) {
+            throw new RuntimeException(e);
+        }
+    }
+}
@@ -0,0 +1,386 @@
+package dgsgraphstreamanimate;
+
+import java.awt.AlphaComposite;
+import java.awt.Graphics2D;
+import java.awt.image.BufferedImage;
+import java.io.File;
+import java.io.IOException;
+import java.io.PrintWriter;
+import java.util.ArrayList;
+import java.util.Arrays;
+import java.util.HashSet;
+import java.util.List;
+import java.util.Locale;
+import java.util.Objects;
+import java.util.Set;
+import java.util.concurrent.ArrayBlockingQueue;
+import java.util.concurrent.BlockingQueue;
+import java.util.concurrent.ConcurrentHashMap;
+import java.util.concurrent.ExecutorService;
+import java.util.concurrent.Executors;
+import java.util.concurrent.Semaphore;
+import java.util.concurrent.TimeUnit;
+import java.util.concurrent.locks.Lock;
+import java.util.concurrent.locks.ReentrantReadWriteLock;
+import javax.imageio.ImageIO;
+import org.graphstream.graph.Node;
+import org.graphstream.graph.Edge;
+import org.graphstream.graph.Element;
+import org.graphstream.ui.batik.BatikGraphics2D;
+import org.graphstream.ui.j2dviewer.J2DGraphRenderer;
+import org.graphstream.ui.graphicGraph.GraphicGraph;
+import org.graphstream.ui.graphicGraph.GraphicNode;
+import org.graphstream.ui.graphicGraph.StyleGroup;
+import org.graphstream.ui.graphicGraph.stylesheet.StyleConstants;
+import org.graphstream.ui.util.swing.FontCache;
+
+/**
+ * Pool of threads rendering frames from immutable snapshots of the GraphicGraph, so that the layout of the next
+ * frames overlaps with the rendering of the previous ones. Each thread renders with its own GraphicGraph,
+ * J2DGraphRenderer and image buffer, brought up to date with the snapshot of each frame before rendering it.
+ * Frames are written with the file names given by their snapshot, whatever the order in which they are rendered.
+ * Overlapping elements are drawn in the order set by DrawingOrder, as on the layout thread.
+ *
+ * The only state of the J2D renderer shared between threads is held by two global and unsynchronized Scala objects:
+ * org.graphstream.ui.util.swing.FontCache (fonts of the text boxes, loaded by ShapeDecor.TextBox and JComponentRenderer)
+ * and org.graphstream.ui.util.swing.ImageCache (fill images of ShapePaint and GraphBackgroundRenderer, icons of
+ * ShapeDecor, image arrows of ArrowShapes and JComponentRenderer). Renders hold the read lock of SHARED_CACHES_LOCK:
+ * the fonts of the style groups missing from the font cache are loaded under the write lock before rendering, and
+ * frames whose styles use images or JComponent shapes are rendered under the write lock, so that the caches are never
+ * modified while another frame is rendered.
+ */
+public class FrameRenderPool {
+
+    // Attributes affecting the rendering, copied from the GraphicGraph into the snapshots
+    private static final String[] NODE_ATTRIBUTES = {"ui.style", "ui.pie-values", "ui.size", "ui.class", "ui.hide", "label"};
+    private static final String[] EDGE_ATTRIBUTES = {"ui.style", "ui.size", "ui.class", "ui.hide", "label"};
+
+    // Global to the JVM like the GraphStream caches it protects (several pools may render in the same JVM)
+    private static final ReentrantReadWriteLock SHARED_CACHES_LOCK = new ReentrantReadWriteLock();
+    private static final Set<String> CACHED_FONTS = ConcurrentHashMap.newKeySet(); // Fonts already in FontCache, as font/style/size
+
+    /**
+     * Immutable description of a frame: node positions, nodes and edges with their rendering attributes
+     * and the files to write (null if a format is not rendered for this frame)
+     */
+    public static class FrameSnapshot {
+        private final String[] nodeIds;
+        private final double[] nodeX;
+        private final double[] nodeY;
+        private final Object[][] nodeAttributes; // values of NODE_ATTRIBUTES per node (null if not set)
+        private final String[] edgeIds;
+        private final String[] edgeSources;
+        private final String[] edgeTargets;
+        private final Object[][] edgeAttributes; // values of EDGE_ATTRIBUTES per edge (null if not set)
+        private final String svgFilepath;
+        private final String pngFilepath;
+
+        private FrameSnapshot(GraphicGraph graph, String svgFilepath, String pngFilepath) {
+            int nodeCount = graph.getNodeCount();
+            this.nodeIds = new String[nodeCount];
+            this.nodeX = new double[nodeCount];
+            this.nodeY = new double[nodeCount];
+            this.nodeAttributes = new Object[nodeCount][];
+            int i = 0;
+            for (Node node : graph) {
+                GraphicNode n = (GraphicNode)node;
+                this.nodeIds[i] = n.getId();
+                this.nodeX[i] = n.getX();
+                this.nodeY[i] = n.getY();
+                this.nodeAttributes[i] = getAttributes(n, NODE_ATTRIBUTES);
+                i++;
+            }
+            int edgeCount = graph.getEdgeCount();
+            this.edgeIds = new String[edgeCount];
+            this.edgeSources = new String[edgeCount];
+            this.edgeTargets = new String[edgeCount];
+            this.edgeAttributes = new Object[edgeCount][];
+            i = 0;
+            for (Edge edge : graph.getEachEdge()) {
+                this.edgeIds[i] = edge.getId();
+                this.edgeSources[i] = edge.getSourceNode().getId();
+                this.edgeTargets[i] = edge.getTargetNode().getId();
+                this.edgeAttributes[i] = getAttributes(edge, EDGE_ATTRIBUTES);
+                i++;
+            }
+            this.svgFilepath = svgFilepath;
+            this.pngFilepath = pngFilepath;
+        }
+
+        /**
+         * Snapshot the current state of a GraphicGraph. Attribute values are shared with the graph, they are
+         * never modified in place (DgsGraphStreamAnimate always sets new values).
+         */
+        public static FrameSnapshot capture(GraphicGraph graph, String svgFilepath, String pngFilepath) {
+            return new FrameSnapshot(graph, svgFilepath, pngFilepath);
+        }
+
+        private static Object[] getAttributes(Element element, String[] keys) {
+            Object[] values = new Object[keys.length];
+            for (int k = 0; k < keys.length; k++) {
+                values[k] = element.getAttribute(keys[k]);
+            }
+            return values;
+        }
+    }
+
+    /**
+     * Renderer owned by one thread at a time, its GraphicGraph is updated incrementally from the snapshots
+     * (only the changed attributes are set so that the node styles are not parsed again at each frame)
+     */
+    private class Renderer {
+        private final GraphicGraph graph;
+        private final J2DGraphRenderer renderer;
+        private final BufferedImage image;
+
+        Renderer(int index) {
+            this.graph = new GraphicGraph("render_" + index);
+            this.graph.addAttribute("ui.stylesheet", styleSheet);
+            this.graph.addAttribute("ui.quality"); // same quality as FileSinkImages with Quality.HIGH
+            this.graph.addAttribute("ui.antialias");
+            this.renderer = new J2DGraphRenderer();
+            this.renderer.open(this.graph, null);
+            this.image = new BufferedImage(width, height, BufferedImage.TYPE_INT_ARGB);
+        }
+
+        private void update(FrameSnapshot snapshot) {
+            for (int i = 0; i < snapshot.nodeIds.length; i++) {
+                GraphicNode node = this.graph.getNode(snapshot.nodeIds[i]);
+                if (node == null) {
+                    node = this.graph.addNode(snapshot.nodeIds[i]);
+                }
+                node.move(snapshot.nodeX[i], snapshot.nodeY[i], 0);
+                setAttributes(node, NODE_ATTRIBUTES, snapshot.nodeAttributes[i]);
+            }
+            for (int i = 0; i < snapshot.edgeIds.length; i++) {
+                Edge edge = this.graph.getEdge(snapshot.edgeIds[i]);
+                if (edge == null) {
+                    edge = this.graph.addEdge(snapshot.edgeIds[i], snapshot.edgeSources[i], snapshot.edgeTargets[i]);
+                }
+                setAttributes(edge, EDGE_ATTRIBUTES, snapshot.edgeAttributes[i]);
+            }
+            // Remove the nodes and edges not in this frame (the renderer may have rendered a later frame before)
+            if (this.graph.getNodeCount() != snapshot.nodeIds.length || this.graph.getEdgeCount() != snapshot.edgeIds.length) {
+                removeMissingElements(snapshot);
+            }
+        }
+
+        private void removeMissingElements(FrameSnapshot snapshot) {
+            Set<String> edgeIds = new HashSet<String>(Arrays.asList(snapshot.edgeIds));
+            List<String> removedEdges = new ArrayList<String>();
+            for (Edge edge : this.graph.getEachEdge()) {
+                if (!edgeIds.contains(edge.getId())) {
+                    removedEdges.add(edge.getId());
+                }
+            }
+            for (String edgeId : removedEdges) {
+                this.graph.removeEdge(edgeId);
+            }
+            Set<String> nodeIds = new HashSet<String>(Arrays.asList(snapshot.nodeIds));
+            List<String> removedNodes = new ArrayList<String>();
+            for (Node node : this.graph) {
+                if (!nodeIds.contains(node.getId())) {
+                    removedNodes.add(node.getId());
+                }
+            }
+            for (String nodeId : removedNodes) {
+                this.graph.removeNode(nodeId);
+            }
+        }
+
+        private void setAttributes(Element element, String[] keys, Object[] values) {
+            for (int k = 0; k < keys.length; k++) {
+                Object current = element.getAttribute(keys[k]);
+                if (values[k] == null) {
+                    if (current != null) {
+                        element.removeAttribute(keys[k]);
+                    }
+                } else if (!Objects.equals(values[k], current)) {
+                    element.setAttribute(keys[k], values[k]);
+                }
+            }
+        }
+
+        /**
+         * Load the fonts of the style groups missing from FontCache (under the write lock, the lock is not held
+         * by the caller) and return whether the styles load images from ImageCache while rendering
+         */
+        private Boolean prepareSharedCaches() {
+            Boolean usesImages = false;
+            List<StyleGroup> missingFonts = new ArrayList<StyleGroup>();
+            for (StyleGroup group : this.graph.getStyleGroups().groups()) {
+                if (!CACHED_FONTS.contains(getFontKey(group))) {
+                    missingFonts.add(group);
+                }
+                usesImages |= usesImages(group);
+            }
+            if (!missingFonts.isEmpty()) {
+                SHARED_CACHES_LOCK.writeLock().lock();
+                try {
+                    for (StyleGroup group : missingFonts) {
+                        // Same calls as TextBox and JComponentRenderer
+                        int size = (int)group.getTextSize().value;
+                        FontCache.getFont(group.getTextFont(), group.getTextStyle(), size);
+                        FontCache.getDefaultFont(group.getTextStyle(), size);
+                        CACHED_FONTS.add(getFontKey(group));
+                    }
+                } finally {
+                    SHARED_CACHES_LOCK.writeLock().unlock();
+                }
+            }
+            return usesImages;
+        }
+
+        private String getFontKey(StyleGroup group) {
+            return group.getTextFont() + "/" + group.getTextStyle() + "/" + (int)group.getTextSize().value;
+        }
+
+        private Boolean usesImages(StyleGroup group) {
+            switch (group.getFillMode()) {
+                case IMAGE_TILED:
+                case IMAGE_SCALED:
+                case IMAGE_SCALED_RATIO_MAX:
+                case IMAGE_SCALED_RATIO_MIN:
+                    return true;
+                default:
+                    return group.getIconMode() != StyleConstants.IconMode.NONE
+                        || group.getArrowShape() == StyleConstants.ArrowShape.IMAGE
+                        || group.getShape() == StyleConstants.Shape.JCOMPONENT;
+            }
+        }
+
+        /**
+         * Render a frame and return the time spent writing the svg and png files in nanoseconds
+         */
+        long[] render(FrameSnapshot snapshot) throws IOException {
+            update(snapshot);
+            DrawingOrder.sort(this.graph); // same drawing order as the layout thread, whatever the frames rendered before
+            Lock lock = prepareSharedCaches() ? SHARED_CACHES_LOCK.writeLock() : SHARED_CACHES_LOCK.readLock();
+            long svgTime = 0, pngTime = 0;
+            if (snapshot.svgFilepath != null) {
+                long start = System.nanoTime();
+                BatikGraphics2D output = new BatikGraphics2D();
+                lock.lock();
+                try {
+                    this.renderer.render(output.getGraphics(), 0, 0, width, height);
+                } finally {
+                    lock.unlock();
+                }
+                output.outputTo(snapshot.svgFilepath);
+                svgTime = System.nanoTime() - start;
+            }
+            if (snapshot.pngFilepath != null) {
+                long start = System.nanoTime();
+                Graphics2D graphics = this.image.createGraphics();
+                graphics.setComposite(AlphaComposite.Clear); // reuse the image buffer of the previous frame
+                graphics.fillRect(0, 0, width, height);
+                graphics.setComposite(AlphaComposite.SrcOver);
+                lock.lock();
+                try {
+                    this.renderer.render(graphics, 0, 0, width, height);
+                } finally {
+                    lock.unlock();
+                    graphics.dispose();
+                }
+                ImageIO.write(this.image, "png", new File(snapshot.pngFilepath));
+                pngTime = System.nanoTime() - start;
+            }
+            return new long[] {svgTime, pngTime};
+        }
+    }
+
+    private final String styleSheet;
+    private final int width;
+    private final int height;
+    private final PrintWriter metricsWriter; // Per-frame metrics (CSV), null if disabled
+    private final ExecutorService executor;
+    private final BlockingQueue<Renderer> renderers; // Renderers not in use
+    private final Semaphore pendingFrames; // Limits the number of snapshots waiting to be rendered
+    private volatile Exception failure; // First rendering error, reported to the layout thread
+
+    public FrameRenderPool(int threadCount, String styleSheet, int width, int height, PrintWriter metricsWriter) {
+        this.styleSheet = styleSheet;
+        this.width = width;
+        this.height = height;
+        this.metricsWriter = metricsWriter;
+        this.executor = Executors.newFixedThreadPool(threadCount, runnable -> {
+            Thread thread = new Thread(runnable, "frame-renderer");
+            thread.setDaemon(true); // do not keep the JVM alive if the job fails
+            return thread;
+        });
+        this.renderers = new ArrayBlockingQueue<Renderer>(threadCount);
+        for (int i = 0; i < threadCount; i++) {
+            this.renderers.add(new Renderer(i));
+        }
+        this.pendingFrames = new Semaphore(2 * threadCount);
+        this.failure = null;
+    }
+
+    /**
+     * Render a frame in the pool, blocking while too many frames are waiting to be rendered.
+     * metrics is the start of the metrics row of the frame, completed with the render timings once rendered.
+     */
+    public void submit(FrameSnapshot snapshot, String metrics) {
+        checkFailure();
+        this.pendingFrames.acquireUninterruptibly();
+        try {
+            this.executor.execute(() -> {
+                try {
+                    render(snapshot, metrics);
+                } finally {
+                    this.pendingFrames.release();
+                }
+            });
+        } catch (RuntimeException e) {
+            this.pendingFrames.release();
+            throw e;
+        }
+    }
+
+    private void render(FrameSnapshot snapshot, String metrics) {
+        Renderer renderer = null;
+        try {
+            renderer = this.renderers.take();
+            long[] times = renderer.render(snapshot);
+            if (this.metricsWriter != null && metrics != null) {
+                synchronized (this.metricsWriter) { // rows are written in rendering order
+                    this.metricsWriter.println(metrics + String.format(Locale.ROOT, ",%d,%d", times[0], times[1]));
+                }
+            }
+        } catch (Exception e) {
+            if (this.failure == null) {
+                this.failure = e;
+            }
+        } finally {
+            if (renderer != null) {
+                this.renderers.add(renderer);
+            }
+        }
+    }
+
+    private void checkFailure() {
+        if (this.failure != null) {
+            throw new RuntimeException("Frame rendering failed", this.failure);
+        }
+    }
+
+    /**
+     * Wait for all the submitted frames to be rendered
+     */
+    public void close() {
+        this.executor.shutdown();
+        try {
+            this.executor.awaitTermination(Long.MAX_VALUE, TimeUnit.NANOSECONDS);
+        } catch (InterruptedException e) {
+            throw new RuntimeException(e);
+        }
+        checkFailure();
+    }
+
+    /**
+     * Stop rendering without waiting for the submitted frames (when the job fails)
+     */
+    public void shutdown() {
+        this.executor.shutdownNow();
+    }
+}
@@ -1,114 +1,147 @@
 #!/usr/bin/env python3
 
 import os
+import re
+import gzip
 import logging
+import itertools
+import numpy as np
 import networkx as nx
 from collections import defaultdict
 
 import utils
 
+def get_metis_file_format(file_format):
+    # FMT has the following meanings:
+    #  0  the graph has no weights (in this case, you can omit FMT)
+    #  1  the graph has edge weights
+    # 10  the graph has node weights
+    # 11  the graph has both edge and node weights
+    has_edge_weights = False
+    has_node_weights = False
+    if int(file_format) == 0:
+        pass
+    elif int(file_format) == 1:
+        has_edge_weights = True
+    elif int(file_format) == 10:
+        has_node_weights = True
+    elif int(file_format) == 11:
+        has_edge_weights = True
+        has_node_weights = True
+    else:
+        assert False, "File format not supported"
+    return has_edge_weights, has_node_weights
+
+def read_metis_csr(file):
+    '''
+    Read a METIS file into 0-based CSR arrays in a single tokenizing pass.
+    Returns (m_nodes, m_edges, xadj, adjncy, node_weights, edge_weights) where node_weights holds
+    the 1st weight of each node (None if the file has no node weights) and edge_weights holds the
+    weight of each adjncy entry (None if the file has no edge weights).
+    '''
+    with open(file, "r") as metis:
+        data = re.sub(r'^%[^\n]*(\n|$)', '', metis.read(), flags=re.MULTILINE) # ignore comments
+
+    # read meta data from first line
+    header, _, body = data.partition('\n')
+    first_line = header.split()
+    m_nodes = int(first_line[0])
+    m_edges = int(first_line[1])
+    has_edge_weights = False
+    has_node_weights = False
+    n_vertex_weights = 1
+    if len(first_line) > 2:
+        has_edge_weights, has_node_weights = get_metis_file_format(first_line[2])
+    if len(first_line) > 3:
+        #  NCON, it appears, is the number of vertex weights.  Normally,
+        #  if vertex weights are used, there is only one weight per vertex,
+        #  and it is not even necessary to list NCON in the input.  But if
+        #  multiple values are associated with a vertex, NCON must be listed.
+        n_vertex_weights = int(first_line[3])
+    if not has_node_weights:
+        n_vertex_weights = 0
+
+    # tokenize all lines at once, each line being terminated by a -1 sentinel value
+    if body and not body.endswith('\n'):
+        body += '\n'
+    tokens = np.fromstring(body.replace('\n', ' -1 '), dtype=np.int64, sep=' ')
+    line_ends = np.flatnonzero(tokens == -1)
+    line_lengths = np.diff(np.concatenate(([-1], line_ends))) - 1 # number of values per line (one line per node)
+    values = tokens[tokens != -1]
+    n = len(line_lengths)
+    line_starts = np.cumsum(line_lengths) - line_lengths
+
+    # position of each value in its line and node it belongs to
+    positions = np.arange(len(values)) - np.repeat(line_starts, line_lengths)
+    line_nodes = np.repeat(np.arange(n), line_lengths)
+
+    # node weights: 1st weight of non-blank lines (a blank line indicates no node weight)
+    node_weights = None
+    if has_node_weights:
+        node_weights = np.ones(n, dtype=np.int64)
+        non_blank = line_lengths > 0
+        node_weights[non_blank] = values[line_starts[non_blank]] # use 1st node weight
+
+    # adjacency: values after the node weights, as (node, weight) pairs if the graph has edge weights
+    adjacency_mask = positions >= n_vertex_weights
+    adjacency_values = values[adjacency_mask]
+    adjacency_nodes = line_nodes[adjacency_mask]
+    edge_weights = None
+    if has_edge_weights:
+        assert np.all((line_lengths[line_lengths > 0] - n_vertex_weights) % 2 == 0), "Expected (node, weight) pairs in METIS file with edge weights"
+        neighbor_mask = (positions[adjacency_mask] - n_vertex_weights) % 2 == 0
+        edge_weights = adjacency_values[~neighbor_mask]
+        adjacency_values = adjacency_values[neighbor_mask]
+        adjacency_nodes = adjacency_nodes[neighbor_mask]
+
+    # METIS starts node count from 1, here we start from 0
+    adjncy = (adjacency_values - 1).astype(np.int32)
+    xadj = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(adjacency_nodes, minlength=n), out=xadj[1:])
+    return m_nodes, m_edges, xadj, adjncy, node_weights, edge_weights
+
 def read_metis(file):
     logging.info("Reading METIS file %s", file)
 
-    G = nx.Graph() # create undirected graph
-
-    # add node weights from METIS file
-    with open(file, "r") as metis:
+    m_nodes, m_edges, xadj, adjncy, node_weights, edge_weights = read_metis_csr(file)
+    n = len(xadj) - 1
+    degrees = np.diff(xadj)
+    sources = np.repeat(np.arange(n), degrees)
+
+    # insert nodes in order of first appearance in the file (each node followed by its neighbors)
+    # so that node and adjacency iteration orders match a line by line construction
+    sequence = np.empty(n + len(adjncy), dtype=np.int64)
+    node_positions = xadj[:-1] + np.arange(n)
+    sequence[node_positions] = np.arange(n)
+    neighbor_mask = np.ones(len(sequence), dtype=bool)
+    neighbor_mask[node_positions] = False
+    sequence[neighbor_mask] = adjncy
+    _, first_positions = np.unique(sequence, return_index=True)
+    node_sequence = sequence[np.sort(first_positions)].tolist()
 
-        n = 0
-        first_line = None
-        has_edge_weights = False
-        has_node_weights = False
-        n_vertex_weights = 1
-        for i, line in enumerate(metis):
-            if line[0] == '%':
-                # ignore comments
-                continue
-
-            if not first_line:
-                # read meta data from first line
-                first_line = line.split()
-                m_nodes = int(first_line[0])
-                m_edges = int(first_line[1])
-                if len(first_line) > 2:
-                    # FMT has the following meanings:
-                    #  0  the graph has no weights (in this case, you can omit FMT)
-                    #  1  the graph has edge weights
-                    # 10  the graph has node weights
-                    # 11  the graph has both edge and node weights
-                    file_format = first_line[2]
-                    if int(file_format) == 0:
-                        pass
-                    elif int(file_format) == 1:
-                        has_edge_weights = True
-                    elif int(file_format) == 10:
-                        has_node_weights = True
-                    elif int(file_format) == 11:
-                        has_edge_weights = True
-                        has_node_weights = True
-                    else:
-                        assert False, "File format not supported"
-                if len(first_line) > 3:
-                    #  NCON, it appears, is the number of vertex weights.  Normally,
-                    #  if vertex weights are used, there is only one weight per vertex,
-                    #  and it is not even necessary to list NCON in the input.  But if
-                    #  multiple values are associated with a vertex, NCON must be listed.
-                    n_vertex_weights = int(first_line[3])
-                continue
-
-            # METIS starts node count from 1, here we start from 0 by
-            # subtracting 1 in the edge list and incrementing 'n' after
-            # processing the line.
-            if line.strip():
-                e = line.split()
-                if has_edge_weights and has_node_weights:
-                    node_weights = e[0:n_vertex_weights]
-                    if len(e) > n_vertex_weights:
-                        # create weighted edge list:
-                        #  [(1, 2, {'weight':'2'}), (1, 3, {'weight':'8'})]
-                        edges = e[n_vertex_weights:]
-                        edges_split = list(zip(*[iter(edges)] * 2))
-                        edge_list = [(n, int(v[0]) - 1, {'weight': int(v[1])}) for v in edges_split]
-
-                        G.add_edges_from(edge_list)
-                        G.node[n]['weight'] = int(node_weights[0]) # use 1st node weight
-                    else:
-                        # no edges
-                        G.add_nodes_from([n], weight=int(node_weights[0])) # use 1st node weight
-
-                elif has_edge_weights and not has_node_weights:
-                    n_vertex_weights = 0
-                    if len(e) > 0:
-                        # create weighted edge list:
-                        #  [(1, 2, {'weight':'2'}), (1, 3, {'weight':'8'})]
-                        edges = e[n_vertex_weights:]
-                        edges_split = list(zip(*[iter(edges)] * 2))
-                        edge_list = [(n, int(v[0]) - 1, {'weight': int(v[1])}) for v in edges_split]
-
-                        G.add_edges_from(edge_list)
-                        G.node[n]['weight'] = 1.0
-                    else:
-                        # no edges
-                        G.node[n]['weight'] = 1.0
-                elif not has_edge_weights and has_node_weights:
-                    node_weights = e[0:n_vertex_weights]
-                    if len(e) > n_vertex_weights:
-                        edges = e[n_vertex_weights:]
-                        edge_list = [(n, int(v) - 1, {'weight':1.0}) for v in edges]
-                        G.add_edges_from(edge_list)
-                        G.node[n]['weight'] = int(node_weights[0]) # use 1st node weight
-                    else:
-                        # no edges
-                        G.add_nodes_from([n], weight=int(node_weights[0]))
-                    pass
-                else:
-                    edge_list = [(n, int(v) - 1, {'weight':1.0}) for v in e]
-                    G.add_edges_from(edge_list)
-                    G.node[n]['weight'] = 1.0
-            else:
-                # blank line indicates no node weight
-                G.add_nodes_from([n], weight=1.0)
-            n += 1
+    G = nx.Graph() # create undirected graph
+    G.add_nodes_from(node_sequence)
+
+    # add node weights (1.0 if the file has no node weights)
+    if node_weights is None:
+        nx.set_node_attributes(G, name='weight', values=1.0)
+    else:
+        nx.set_node_attributes(G, name='weight', values=dict(zip(range(n), node_weights.tolist())))
+
+    # keep a single entry per undirected edge: its first occurrence sets the adjacency order
+    # and its last occurrence sets the weight, as when inserting both entries one after the other
+    node_count = max(n, int(adjncy.max()) + 1 if len(adjncy) else 0)
+    keys = np.minimum(sources, adjncy) * node_count + np.maximum(sources, adjncy)
+    _, first_entries = np.unique(keys, return_index=True)
+    _, last_entries = np.unique(keys[::-1], return_index=True)
+    last_entries = len(keys) - 1 - last_entries
+    insertion_order = np.argsort(first_entries)
+    first_entries = first_entries[insertion_order]
+    last_entries = last_entries[insertion_order]
+
+    # add weighted edges in bulk (weight of 1.0 if the file has no edge weights)
+    weights = itertools.repeat(1.0) if edge_weights is None else edge_weights[last_entries].tolist()
+    G.add_weighted_edges_from(zip(sources[first_entries].tolist(), adjncy[first_entries].tolist(), weights))
 
     # sanity check
     assert (m_nodes == G.number_of_nodes()), "Expected {} nodes, networkx graph contains {} nodes".format(m_nodes, G.number_of_nodes())
@@ -190,32 +223,53 @@ def read_infomap_tree_file(filepath, level):
 
     return node_dict
 
-def get_frame_start_and_count(full_graph, partition, trailing_frame_count):
-    ''' Global frame start and count per node '''
-    sorted_nodes = sorted(full_graph.nodes(data=True), key=lambda node: node[1]['order'])
-    ordered_assignments = [node[1]['partition'] for node in sorted_nodes]
-    partition_frame_start = [i for i, a in enumerate(ordered_assignments) if a == partition] # assignment start indexes for given partition
-    partition_frame_start_extended = partition_frame_start + [len(sorted_nodes) + trailing_frame_count] # add last frame id with extra trailing frames to give highlighted nodes time to settle
-    partition_frame_count = [v2 - v1 for v1, v2 in zip(partition_frame_start_extended, partition_frame_start_extended[1:])] # subtract consecutive frame start values
-    return partition_frame_start, partition_frame_count
-
-def write_dgs_file(output, graph, full_graph, label_type, colour_attr, trailing_frame_count):
+POSITIONS_DTYPE = np.dtype([('id', '>i8'), ('x', '>f8'), ('y', '>f8')]) # records written by DgsGraphStreamAnimate -positions
+
+def read_positions_file(filepath):
+    ''' Node ids and (x, y) positions array exported by DgsGraphStreamAnimate, loaded in a single call '''
+    records = np.fromfile(filepath, dtype=POSITIONS_DTYPE)
+    return records['id'].astype(np.int64), np.column_stack((records['x'], records['y'])).astype(np.float64)
+
+DGS_BUFFERED_LINES = 10000 # number of DGS lines written at once
+
+def get_frame_start_and_count_per_partition(full_graph, trailing_frame_count, nodes_per_frame=1):
+    '''
+    Global frame start and count per node of a CSRGraph, computed once for all partitions.
+    Consecutive nodes are grouped by nodes_per_frame into the same frame, nodes of a group share their frame start and count.
+    '''
+    ranks = np.empty(full_graph.number_of_nodes(), dtype=np.int64)
+    ranks[np.argsort(full_graph.attributes['order'], kind='stable')] = np.arange(full_graph.number_of_nodes()) # global index of each node when sorted by order
+    last_frame = -(-full_graph.number_of_nodes() // nodes_per_frame) + trailing_frame_count # last frame id with extra trailing frames to give highlighted nodes time to settle
+    frame_start_and_count_per_partition = {}
+    for partition, view in full_graph.partition_views().items():
+        partition_frame_start = np.sort(ranks[view.node_indices]) // nodes_per_frame # assignment start indexes for the partition
+        group_frame_start = np.unique(partition_frame_start) # frame start of each group of nodes added at the same step
+        group_frame_count = np.diff(np.append(group_frame_start, last_frame)) # subtract consecutive frame start values
+        partition_frame_count = group_frame_count[np.searchsorted(group_frame_start, partition_frame_start)]
+        frame_start_and_count_per_partition[partition] = (partition_frame_start.tolist(), partition_frame_count.tolist())
+    return frame_start_and_count_per_partition
+
+def get_frame_count_per_partition(frame_start_and_count_per_partition):
+    ''' Number of frames of each partition, from the frame start of its first nodes to the last frame (nodes of a group share their frame count) '''
+    return {partition:(frame_start[-1] + frame_count[-1] - frame_start[0] if frame_start else 0)
+            for partition, (frame_start, frame_count) in frame_start_and_count_per_partition.items()}
+
+def write_dgs_file(output, graph, frame_start_and_count_per_partition, label_type, colour_attr, filename=None, compress=False):
     partition = graph.graph['partition']
-    filename = os.path.join(output, 'partition_{}.dgs'.format(partition))
+    if not filename:
+        filename = os.path.join(output, 'partition_{}.dgs{}'.format(partition, '.gz' if compress else ''))
     logging.info("Writing DGS file %s (partition %d)", filename, partition)
-    with open(filename, 'w') as outf:
-        outf.write("DGS004\n")
-        outf.write("partition_{} 0 0\n".format(partition))
+    with (gzip.open(filename, 'wt', compresslevel=6) if compress else open(filename, 'w')) as outf:
+        lines = ["DGS004\n", "partition_{} 0 0\n".format(partition)]
 
         # get partition start and count per node
-        partition_frame_start, partition_frame_count = get_frame_start_and_count(full_graph, partition, trailing_frame_count)
+        partition_frame_start, partition_frame_count = frame_start_and_count_per_partition[partition]
         # sort nodes according to node_order
         sorted_nodes = sorted(graph.nodes(data=True), key=lambda node: node[1]['order'])
 
         i = 0
         st = 1
-        nodes_added = []
-        edges_added = []
+        nodes_added = set()
         for index, n in enumerate(sorted_nodes):
             node_id = n[0]
 
@@ -239,19 +293,25 @@ def write_dgs_file(output, graph, full_graph, label_type, colour_attr, trailing_
             # Size
             node_size = n[1]['size']
 
-            outf.write("an {} c='{}' l='{}' s='{}' fs='{}' fc='{}' hidden='{}'\n".format(node_id, color, label, node_size, partition_frame_start[index], partition_frame_count[index], hidden))
-            nodes_added += [node_id]
+            lines.append("an {} c='{}' l='{}' s='{}' fs='{}' fc='{}' hidden='{}'\n".format(node_id, color, label, node_size, partition_frame_start[index], partition_frame_count[index], hidden))
+            nodes_added.add(node_id)
 
-            for e in graph.edges(node_id):
-                edge1_id = e[1]
-                edge2_id = e[0]
-                if edge1_id in nodes_added and edge2_id in nodes_added and (edge1_id, edge2_id) not in edges_added:
-                    outf.write("ae {} {} {}\n".format(i, edge1_id, edge2_id))
-                    edges_added += [(edge1_id, edge2_id)]
+            # each edge is added once, when the last of its 2 nodes is added
+            for neighbor_id in graph.adj[node_id]:
+                if neighbor_id in nodes_added:
+                    lines.append("ae {} {} {}\n".format(i, neighbor_id, node_id))
                     i += 1
 
-            outf.write("st {}\n".format(st))
-            st += 1
+            # one step per frame (nodes sharing a frame start are added during the same step)
+            if index == len(sorted_nodes) - 1 or partition_frame_start[index + 1] != partition_frame_start[index]:
+                lines.append("st {}\n".format(st))
+                st += 1
+
+            if len(lines) >= DGS_BUFFERED_LINES:
+                outf.writelines(lines)
+                lines = []
+
+        outf.writelines(lines)
 
     return filename
 
@@ -8,6 +8,10 @@ import configparser
 import subprocess
 import random
 import math
+import time
+import glob
+import functools
+import concurrent.futures
 import networkx as nx
 import nxmetis
 
@@ -17,8 +21,13 @@ import color
 import cluster
 import utils
 import image
+import graphstream
+import cache
+import csr
+import report
 
 DGSGS_JAR = 'dgs-graphstream/dist/dgs-graphstream.jar'
+TRAJECTORY_SIZE_WARNING = 100 * 1024 * 1024 # trajectory files size (bytes) above which a smaller number of frames is suggested
 
 def parse_arguments():
     parent_parser = argparse.ArgumentParser(description=
@@ -28,6 +37,14 @@ def parse_arguments():
     )
     parent_parser.add_argument("-v", "--verbose", action="store_true",
                         help="increase output verbosity")
+    parent_parser.add_argument("-j", "--jobs", type=int, default=1, metavar='N',
+                        help="number of partitions processed in parallel by the GraphStream JVM workers and clustering processes (default=1)")
+    parent_parser.add_argument("--render-threads", type=int, default=1, metavar='N',
+                        help="number of threads rendering the frames of each partition while GraphStream lays out the next frames (default=1, rendered on the layout thread)")
+    parent_parser.add_argument("--profile", metavar='FILE',
+                        help="write a JSON report with the time, memory, subprocesses, files written and counts of each stage and partition")
+    parent_parser.add_argument("--cprofile", action="store_true",
+                        help="also write cProfile statistics of each stage next to the report (<report>_<stage>.prof). Use with --profile")
 
     # Required arguments
     required_group = parent_parser.add_argument_group('required arguments')
@@ -44,6 +61,8 @@ def parse_arguments():
                         help='node order list')
     order_group.add_argument('--order-seed', type=int, default=utils.get_random_seed(), metavar='S',
                         help='seed for ordering nodes')
+    io_group.add_argument('--dgs', choices=['file', 'gzip', 'stream'], default='file',
+                        help='DGS files passed to GraphStream as files, gzip-compressed files or streamed through FIFOs while being generated without being kept (default=file)')
     io_group.add_argument('--filter',
                         help='filter node list (<= 0 to exclude node)')
     io_group.add_argument('--node-weight', default='weight', metavar='W',
@@ -79,15 +98,23 @@ def parse_arguments():
                         help='attraction factor for graph layout (default=0.06 for springbox, default=0.0 for linlog)')
     layout_group.add_argument('--repulsion', type=float, metavar='R',
                         help='repulsion factor for graph layout (default=0.024 for springbox, default=-1.2 for linlog)')
+    layout_group.add_argument('--layout-stabilization', type=float, metavar='S',
+                        help='adaptive layout: iterate the layout of each frame until this stabilization value (0 to 1) is reached, instead of a single iteration')
+    layout_group.add_argument('--layout-step-time', type=int, metavar='T',
+                        help='adaptive layout: layout time budget per frame in milliseconds')
+    layout_group.add_argument('--layout-max-iterations', type=int, metavar='N',
+                        help='adaptive layout: maximum number of layout iterations per frame (default=100)')
     # Coloring
     coloring_group = parent_parser.add_argument_group('coloring options')
     color_mode_group = coloring_group.add_mutually_exclusive_group()
     color_mode_group.add_argument('--color-scheme', choices=['pastel', 'primary-colors'], default='pastel',
-                        help='color scheme used by gvmap (default=pastel)')
+                        help='color scheme (default=pastel)')
     color_mode_group.add_argument('--node-color', metavar='C',
                         help='single color to use for all nodes')
+    coloring_group.add_argument('--coloring', choices=['gvmap', 'dsatur'],
+                        help='coloring method, dsatur colors the clusters in process without gvmap (default=gvmap)')
     coloring_group.add_argument('--color-seed', type=int, default=utils.get_random_seed(), metavar='S',
-                        help='seed for coloring with gvmap')
+                        help='seed for coloring')
     coloring_group.add_argument('--shadow-color', metavar='C',
                         help='color of the shadow to use for highlighted nodes. Use with --node-size-mode highlight-new')
     # Image style
@@ -112,18 +139,27 @@ def parse_arguments():
                         help='image width (default=1280)')
     styling_group.add_argument('--height', type=int, default=720, metavar='H',
                         help='image height (default=720)')
+    # Animation
+    animation_group = parent_parser.add_argument_group('animation options')
+    frame_group = animation_group.add_mutually_exclusive_group()
+    frame_group.add_argument('--nodes-per-frame', type=int, metavar='K',
+                        help='number of consecutive nodes added at each animation step (default=1)')
+    frame_group.add_argument('--max-frames', type=int, metavar='F',
+                        help='maximum number of animation steps, consecutive nodes being grouped into steps to fit in this budget')
     # Video
     video_group = parent_parser.add_argument_group('video options')
     video_group.add_argument('--video',
                         help='output video file with tiled frames')
+    video_group.add_argument('--keep-frames', action='store_true',
+                        help='write the joined png frames and create the video from them instead of streaming the frames into ffmpeg')
     video_group.add_argument('--fps', type=int,
                         help='frames per second (default=8)')
     video_group.add_argument('--padding-time', type=float,
                         help='padding time in seconds to add extra frames at the end of the video (default=2.0)')
     # Pdf
     pdf_group = parent_parser.add_argument_group('pdf options')
-    pdf_group.add_argument('--pdf', type=int, default=20, metavar='P',
-                        help='Percentage of frames to convert to pdf (default=20)')
+    pdf_group.add_argument('--pdf', type=int, metavar='P',
+                        help='Percentage of frames to convert to pdf (no pdf is exported without this option)')
 
     # Scheme
     scheme_group = parent_parser.add_argument_group('scheme option')
@@ -132,8 +168,8 @@ def parse_arguments():
 
     # Clustering
     clustering_group = parent_parser.add_argument_group('communities options (only for scheme=communities)')
-    clustering_group.add_argument('--clustering', '-c', choices=['oslom2','infomap','graphviz'],
-                        help='clustering method (default=oslom2)')
+    clustering_group.add_argument('--clustering', '-c', choices=['oslom2','infomap','graphviz','label-propagation'],
+                        help='clustering method, label-propagation runs in process without external tools (default=oslom2)')
     clustering_group.add_argument('--cluster-seed', type=int, metavar='S',
                         help='seed for clustering')
     clustering_group.add_argument('--infomap-calls', type=int, metavar='C',
@@ -146,6 +182,13 @@ def parse_arguments():
     cut_edges_group.add_argument('--cut-edge-node-size', metavar='S',
                         help='size of the nodes attached to cut edges (default=10)')
 
+    # Cache
+    cache_group = parent_parser.add_argument_group('cache options')
+    cache_group.add_argument('--cache-dir', metavar='D',
+                        help='directory of the stage cache used to reuse the results of unchanged stages between runs. Stages depending on a seed are only reused if the seed is set, cached results are not reused after the code or the jar is updated')
+    cache_group.add_argument('--cache-size', type=int, default=10240, metavar='M',
+                        help='maximum size of the stage cache in MB. Least recently used stages are evicted first (default=10240)')
+
     return parent_parser.parse_args()
 
 def validate_arguments(args):
@@ -156,6 +199,11 @@ def validate_arguments(args):
         logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
     errors = []
+    # Jobs
+    if args.jobs < 1:
+        errors.append("The --jobs value must be strictly positive")
+    if args.render_threads < 1:
+        errors.append("The --render-threads value must be strictly positive")
     # Partitioning
     if not args.assignments:
         if args.nparts == None:
@@ -178,6 +226,14 @@ def validate_arguments(args):
             errors.append("The --tpwgts option requires a list of {} values (one value per partition)".format(args.nparts))
         if args.tpwgts and not math.isclose(sum(args.tpwgts), 1.0, rel_tol=1e-5):
             errors.append("The sum of --tpwgts values must be 1.0 (currently {})".format(sum(args.tpwgts)))
+    # Profiling
+    if args.cprofile and not args.profile:
+        errors.append("The --cprofile option is only available with the --profile option")
+    # Coloring
+    if args.node_color and args.coloring:
+        errors.append("The --coloring option is not available with the --node-color option")
+    if args.coloring == 'dsatur' and args.scheme == 'communities' and args.clustering == 'graphviz':
+        errors.append("The dsatur coloring method is not available with the graphviz clustering method")
     # Clustering
     if args.scheme == 'communities':
         if args.clustering and args.clustering == 'graphviz' and args.cluster_seed:
@@ -203,6 +259,22 @@ def validate_arguments(args):
         errors.append("The --force option is only available with the linlog layout")
     if not args.video and args.fps:
         errors.append("The --fps option is only available with the --video option")
+    if args.layout_stabilization != None and (args.layout_stabilization <= 0 or args.layout_stabilization > 1):
+        errors.append("The --layout-stabilization value must be between 0 and 1")
+    if args.layout_step_time != None and args.layout_step_time <= 0:
+        errors.append("The --layout-step-time value must be strictly positive")
+    if args.layout_max_iterations != None and args.layout_max_iterations <= 0:
+        errors.append("The --layout-max-iterations value must be strictly positive")
+    if args.layout_max_iterations and not (args.layout_stabilization or args.layout_step_time):
+        errors.append("The --layout-max-iterations option is only available with --layout-stabilization or --layout-step-time")
+    if args.nodes_per_frame != None and args.nodes_per_frame <= 0:
+        errors.append("The --nodes-per-frame value must be strictly positive")
+    if args.max_frames != None and args.max_frames <= 0:
+        errors.append("The --max-frames value must be strictly positive")
+    if args.pdf != None and (args.pdf <= 0 or args.pdf > 100):
+        errors.append("The --pdf value must be between 1 and 100")
+    if not args.video and args.keep_frames:
+        errors.append("The --keep-frames option is only available with the --video option")
     if not args.video and args.padding_time:
         errors.append("The --padding-time option is only available with the --video option")
     # Image style
@@ -213,6 +285,12 @@ def validate_arguments(args):
     if args.max_node_size and args.node_size_mode == 'fixed':
         errors.append("The --max-node-size option is only available with --node-size-mode centrality or highlight-new")
 
+    # Cache
+    if args.cache_dir and os.path.abspath(args.cache_dir).startswith(os.path.join(os.path.abspath(args.output_dir), '')):
+        errors.append("The --cache-dir directory cannot be inside the output directory")
+    if args.cache_size <= 0:
+        errors.append("The --cache-size value must be strictly positive")
+
     # Print errors and exit if any error found
     if errors:
         for error in errors:
@@ -230,6 +308,8 @@ def validate_arguments(args):
             args.attraction = 0.0
         if not args.repulsion:
             args.repulsion = -1.2
+    if not args.coloring:
+        args.coloring = 'gvmap'
     if not args.fps:
         args.fps = 8
     if not args.padding_time:
@@ -264,15 +344,21 @@ def parse_config_file(config_file):
     return config
 
 def validate_install_dir(config_name, executable, errors):
-    tool_bin = os.path.join(config['install_dirs'][config_name], executable)
+    tool_bin = os.path.join(config['install_dirs'].get(config_name, ''), executable)
     if not os.path.isfile(tool_bin):
-        errors.append("The {} executable cannot be found in the directory {}. Please update the config file with the correct path.".format(config_name, config['install_dirs'][config_name]))
+        errors.append("The {} executable cannot be found in the directory {}. Please update the config file with the correct path.".format(config_name, config['install_dirs'].get(config_name)))
 
-def validate_config(config):
+def validate_config(config, args):
+    # Only check the external tools used by this run
     errors = []
-    validate_install_dir('gvmap', 'gvmap', errors)
-    validate_install_dir('oslom2', 'oslom_undir', errors)
-    validate_install_dir('infomap', 'Infomap', errors)
+    if not 'install_dirs' in config:
+        config['install_dirs'] = {}
+    if not args.node_color and args.coloring == 'gvmap':
+        validate_install_dir('gvmap', 'gvmap', errors)
+    if args.clustering == 'oslom2':
+        validate_install_dir('oslom2', 'oslom_undir', errors)
+    if args.clustering == 'infomap':
+        validate_install_dir('infomap', 'Infomap', errors)
 
     if errors:
         for error in errors:
@@ -283,46 +369,121 @@ def run(args, config):
     # Clean output directory
     utils.create_or_clean_output_dir(args.output_dir)
 
+    # Stage cache (disabled without --cache-dir). Each stage key depends on the keys of the stages it uses.
+    # Seeds are only part of the keys of the stages using them, and the code version (Python modules and jar) of all keys.
+    code_files = [os.path.abspath(__file__), DGSGS_JAR] + [module.__file__ for module in (file_io, graph, color, cluster, utils, image, graphstream, cache, csr, report)]
+    stage_cache = cache.StageCache(args.cache_dir, args.cache_size * 1024 * 1024, cache.get_code_version(code_files) if args.cache_dir else None)
+
+    # Run report (disabled without --profile), subprocesses are recorded in the stage running them
+    run_report = report.RunReport(args.profile, args.output_dir, args.cprofile)
+    report.active_report = run_report
+
+    # Start GraphStream workers (shared by the layout and images passes of all partitions)
+    pool = graphstream.WorkerPool(DGSGS_JAR, args.jobs, args.output_dir)
+
     # Read input graph
-    input_graph = file_io.read_graph_from_file(args.graph, args.format)
+    read_key = stage_cache.get_key('read', cache.get_file_hash(args.graph), args.format)
+    with run_report.stage('read'):
+        input_graph = stage_cache.run('read', read_key, [], file_io.read_graph_from_file, args.graph, args.format)
     logging.info("The input graph contains %d nodes and %d edges", nx.number_of_nodes(input_graph), nx.number_of_edges(input_graph))
+    run_report.set_counts('read', nodes=nx.number_of_nodes(input_graph), edges=nx.number_of_edges(input_graph))
 
     # Read assignments file
-    assignments = get_assignments(args.assignments, args.random_assignments, args.show_partitions, args.filter, args.order, input_graph, args.nparts, args.ubvec, args.tpwgts, args.node_weight, args.edge_weight, args.partition_seed)
+    assign_key = stage_cache.get_key('assign', read_key, cache.get_file_hash(args.assignments), args.random_assignments, args.show_partitions,
+                                     cache.get_file_hash(args.filter), args.nparts, args.ubvec, args.tpwgts, args.node_weight, args.edge_weight,
+                                     args.partition_seed if args.random_assignments else None)
+    with run_report.stage('assign'):
+        assignments = stage_cache.run('assign', assign_key, [], get_assignments, args.assignments, args.random_assignments, args.show_partitions, args.filter, args.order, input_graph, args.nparts, args.ubvec, args.tpwgts, args.node_weight, args.edge_weight, args.partition_seed)
     partitions = get_partitions(assignments) # Getting partitions from the assignments
     log_partitions_info(partitions, assignments)
+    run_report.set_counts('assign', partitions=len(partitions), assigned_nodes=sum(1 for p in assignments.values() if p != -1))
 
     # Split graph into sub-graphs (one per partition)
-    sub_graphs = split_graph(input_graph, assignments, partitions, args.scheme, args.order, args.order_seed, args.node_size_mode, args.node_size, args.min_node_size, args.max_node_size, args.cut_edge_node_size)
+    split_key = stage_cache.get_key('split', assign_key, args.scheme, cache.get_file_hash(args.order), args.order_seed if not args.order else None, args.node_size_mode,
+                                    args.node_size, args.min_node_size, args.max_node_size, args.cut_edge_node_size)
+    with run_report.stage('split'):
+        sub_graphs, assignments = stage_cache.run('split', split_key, [], lambda: (split_graph(input_graph, assignments, partitions, args.scheme, args.order, args.order_seed, args.node_size_mode, args.node_size, args.min_node_size, args.max_node_size, args.cut_edge_node_size), assignments)) # assignments are updated with hidden nodes
 
-    # Generate layout of each sub-graph
+    for sub_graph in sub_graphs:
+        run_report.set_counts('split', sub_graph.graph['partition'], nodes=sub_graph.number_of_nodes(), edges=sub_graph.number_of_edges())
+
+    # Compact graph of all sub-graphs with order and partition columns (used instead of merging the sub-graphs)
+    full_graph = csr.CSRGraph.from_networkx(sub_graphs, {'order': ('int64', 0), 'partition': ('int32', -1)})
+
+    # Compute the global frame start and count per node once for all partitions
     padding_frame_count = math.ceil(args.padding_time * args.fps)
-    generate_layout_per_subgraph(sub_graphs, nx.union_all(sub_graphs), args.output_dir, args.layout, args.layout_seed,
-                     args.force, args.attraction, args.repulsion,
-                     args.node_size_mode, args.shadow_color, args.edge_size, args.label_size, args.label_type, args.cut_edge_length, args.width, args.height, padding_frame_count)
+    nodes_per_frame = get_nodes_per_frame(full_graph.number_of_nodes(), args.nodes_per_frame, args.max_frames)
+    frame_start_and_count_per_partition = file_io.get_frame_start_and_count_per_partition(full_graph, padding_frame_count, nodes_per_frame)
+    trajectory_size = get_trajectory_size(sub_graphs, frame_start_and_count_per_partition)
+    if not args.nodes_per_frame and not args.max_frames and trajectory_size > TRAJECTORY_SIZE_WARNING:
+        logging.warning("The layout may record up to %d MB of node positions (every node added so far at each frame). Use --nodes-per-frame or --max-frames to reduce the number of frames",
+                        trajectory_size // (1024 * 1024))
+
+    # Generate layout of each sub-graph
+    layout_key = stage_cache.get_key('layout', split_key, args.layout, args.layout_seed, args.force, args.attraction, args.repulsion,
+                                     args.cut_edge_length, padding_frame_count, nodes_per_frame, args.layout_stabilization, args.layout_step_time, args.layout_max_iterations)
+    layout_paths = [os.path.join(args.output_dir, 'partition_{}.{}'.format(index, ext)) for index in range(len(sub_graphs)) for ext in ['dot', 'pos', 'traj']]
+    with run_report.stage('layout'):
+        sub_graphs = stage_cache.run('layout', layout_key, layout_paths, generate_layout_per_subgraph, sub_graphs, frame_start_and_count_per_partition, args.output_dir, args.layout, args.layout_seed,
+                         args.force, args.attraction, args.repulsion, args.layout_stabilization, args.layout_step_time, args.layout_max_iterations,
+                         args.node_size_mode, args.shadow_color, args.edge_size, args.label_size, args.label_type, args.cut_edge_length, args.width, args.height, args.dgs, pool)
+    run_report.set_counts('layout', nodes_per_frame=nodes_per_frame)
+    for partition, frame_count in file_io.get_frame_count_per_partition(frame_start_and_count_per_partition).items():
+        run_report.set_counts('layout', partition, frames=frame_count)
 
     # Perform clustering of each sub-graph
-    clusters_per_node_per_graph = create_clusters(sub_graphs, args.output_dir, args.scheme, args.clustering, args.cluster_seed, args.infomap_calls)
+    cluster_key = stage_cache.get_key('cluster', split_key, args.scheme, args.clustering, args.cluster_seed if args.scheme == 'communities' and args.clustering != 'graphviz' else None,
+                                      args.infomap_calls)
+    with run_report.stage('cluster'):
+        clusters_per_node_per_graph = stage_cache.run('cluster', cluster_key, [], create_clusters, sub_graphs, full_graph, args.output_dir, args.scheme, args.clustering, args.cluster_seed, args.infomap_calls, args.jobs)
+    for sub_graph, clusters_per_node in zip(sub_graphs, clusters_per_node_per_graph):
+        run_report.set_counts('cluster', sub_graph.graph['partition'], clusters=len(set(c for clusters in clusters_per_node.values() for c in clusters)))
+    if clusters_per_node_per_graph:
+        cluster.add_clusters_to_graph(sub_graphs, clusters_per_node_per_graph) # Add clusters to graph as node attributes
 
     # Perform coloring
-    perform_coloring(sub_graphs, clusters_per_node_per_graph, args.output_dir, config['install_dirs']['gvmap'], args.node_color, args.color_scheme, args.color_seed)
+    color_key = stage_cache.get_key('color', layout_key, cluster_key, args.node_color, args.coloring, args.color_scheme, args.color_seed if not args.node_color else None)
+    with run_report.stage('color'):
+        colors_per_node = stage_cache.run('color', color_key, [], perform_coloring, sub_graphs, clusters_per_node_per_graph, args.output_dir, config['install_dirs'].get('gvmap'),
+                                          args.node_color, args.coloring, args.color_scheme, args.color_seed)
+    graph.add_node_attribute_to_subgraphs(sub_graphs, 'fillcolor', colors_per_node) # add colors to graphs
+    run_report.set_counts('color', nodes=len(colors_per_node), colors=len(set(colors_per_node.values())))
 
     # Generate frames for each sub-graph
-    create_dgs_file_and_generate_frames(args.output_dir, sub_graphs, nx.union_all(sub_graphs), args.label_type, 'fillcolor', padding_frame_count,
-                                        args.layout, args.layout_seed, args.force, args.attraction, args.repulsion, args.node_size_mode, args.shadow_color,
-                                        args.edge_size, args.label_size, args.cut_edge_length, args.width, args.height, 'images')
+    frames_key = stage_cache.get_key('frames', layout_key, color_key, args.label_type, args.node_size_mode, args.shadow_color,
+                                     args.edge_size, args.label_size, args.width, args.height, args.pdf, args.fps)
+    with run_report.stage('frames'):
+        stage_cache.run('frames', frames_key, [os.path.join(args.output_dir, 'frames_partition')], create_dgs_file_and_generate_frames,
+                        args.output_dir, sub_graphs, frame_start_and_count_per_partition, args.label_type, 'fillcolor',
+                        args.layout, args.layout_seed, args.force, args.attraction, args.repulsion, args.layout_stabilization, args.layout_step_time, args.layout_max_iterations,
+                        args.node_size_mode, args.shadow_color,
+                        args.edge_size, args.label_size, args.cut_edge_length, args.width, args.height, 'images', args.dgs, pool, args.pdf, args.fps, args.render_threads)
+    pool.close()
+    for index, sub_graph in enumerate(sub_graphs): # frame files are named after the sub-graph index
+        run_report.set_counts('frames', sub_graph.graph['partition'], frames=len(glob.glob(os.path.join(args.output_dir, 'frames_partition', 'p{}_*.png'.format(index)))))
 
     # Combine frames into tiles
+    # (frames are streamed into the video unless --keep-frames is set)
+    stream_video = args.video and not args.keep_frames
     if args.video or args.pdf:
-        frame_files_png, frame_files_svg = image.combine_images_into_tiles(args.output_dir, partitions, args.border_size, args.width, args.height, args.fps)
+        tiles_key = stage_cache.get_key('tiles', frames_key, args.output_dir, args.border_size, args.width, args.height, args.fps,
+                                        args.pdf, args.video if stream_video else None)
+        tiles_paths = [os.path.join(args.output_dir, 'frames_joined')] + ([args.video] if stream_video else [])
+        with run_report.stage('tiles'):
+            frame_files_png, frame_files_svg = stage_cache.run('tiles', tiles_key, tiles_paths, image.combine_images_into_tiles, args.output_dir, partitions,
+                                                               args.border_size, args.width, args.height, args.fps, args.jobs, args.pdf, args.video if stream_video else None)
+        run_report.set_counts('tiles', frames=len(frame_files_png), pdf_frames=len(frame_files_svg))
 
     # Convert frames to video
-    if args.video:
-        create_video_from_tiles(args.output_dir, args.video, args.fps)
+    if args.video and not stream_video:
+        video_key = stage_cache.get_key('video', tiles_key, args.fps)
+        with run_report.stage('video'):
+            stage_cache.run('video', video_key, [args.video], create_video_from_tiles, args.output_dir, args.video, args.fps)
 
     # Convert frames to pdfs
     if args.pdf:
-        image.create_pdfs_from_tiles(args.output_dir, frame_files_svg, args.pdf)
+        with run_report.stage('pdf'):
+            image.create_pdfs_from_tiles(args.output_dir, frame_files_svg)
 
 def get_assignments_from_file(assignments_file, graph):
     # Extracting assignments from file
@@ -436,9 +597,7 @@ def run_metis_partitioning(graph, nparts, ubvec, tpwgts, node_weight, edge_weigh
 
 def filter_node_order(node_order, assignments):
     ''' Filter node_order with assignment list '''
-    for node in node_order:
-        if assignments[node] == -1:
-            node_order.remove(node)
+    node_order[:] = [node for node in node_order if assignments[node] != -1]
 
 def get_node_order(order_file, order_seed, total_node_count):
     if order_file:
@@ -487,60 +646,126 @@ def split_graph(input_graph, assignments, partitions, scheme, order, order_seed,
 
     return sub_graphs
 
-def generate_layout_per_subgraph(sub_graphs, full_graph, output_dir, layout, seed, force, attraction, repulsion, node_size_mode, shadow_color,
-                                 edge_size, label_size, label_type, cut_edge_length, width, height, trailing_frame_count):
+def get_nodes_per_frame(node_count, nodes_per_frame, max_frames):
+    if nodes_per_frame:
+        return nodes_per_frame
+    if max_frames:
+        return max(1, math.ceil(node_count / max_frames)) # smallest group size fitting in max_frames steps
+    return 1
+
+def get_trajectory_size(sub_graphs, frame_start_and_count_per_partition):
+    '''
+    Upper bound of the uncompressed size in bytes of the trajectory files: each frame holds the x and y (float32) of every node
+    added so far, i.e. O(frames x nodes) per partition, quadratic in the number of nodes with one node per frame
+    '''
+    frame_count_per_partition = file_io.get_frame_count_per_partition(frame_start_and_count_per_partition)
+    return sum(frame_count_per_partition.get(sub_graph.graph['partition'], 0) * (4 + 8 * sub_graph.number_of_nodes()) for sub_graph in sub_graphs)
+
+def generate_layout_per_subgraph(sub_graphs, frame_start_and_count_per_partition, output_dir, layout, seed, force, attraction, repulsion,
+                                 stabilization, step_time, max_iterations, node_size_mode, shadow_color,
+                                 edge_size, label_size, label_type, cut_edge_length, width, height, dgs_mode, pool):
+
+    dot_filepaths = create_dgs_file_and_generate_frames(output_dir, sub_graphs, frame_start_and_count_per_partition, label_type, None,
+                                                       layout, seed, force, attraction, repulsion, stabilization, step_time, max_iterations, node_size_mode, shadow_color, edge_size,
+                                                       label_size, cut_edge_length, width, height, 'dot', dgs_mode, pool)
+
+    # Load node positions exported next to the dot files
+    for index, sub_graph in enumerate(sub_graphs):
+        sub_graph.graph['positions'] = file_io.read_positions_file(os.path.splitext(dot_filepaths[index])[0] + '.pos')
+
+    return sub_graphs
 
-    dot_filepaths = create_dgs_file_and_generate_frames(output_dir, sub_graphs, full_graph, label_type, None, trailing_frame_count,
-                                                       layout, seed, force, attraction, repulsion, node_size_mode, shadow_color, edge_size,
-                                                       label_size, cut_edge_length, width, height, 'dot')
+def create_dgs_file_and_generate_frames(output_dir, sub_graphs, frame_start_and_count_per_partition, label_type, colour_attr,
+                                        layout, seed, force, attraction, repulsion, stabilization, step_time, max_iterations,
+                                        node_size_mode, shadow_color, edge_size, label_size, cut_edge_length, width, height, mode, dgs_mode, pool,
+                                        pdf_percentage=None, fps=None, render_threads=1):
+    # Svg frames are only rendered for the frames exported as pdf, i.e. every svg_interval frames back from the last frame of each partition
+    formats = ['png']
+    svg_interval = 1
+    frame_count_per_partition = file_io.get_frame_count_per_partition(frame_start_and_count_per_partition)
+    if mode == 'images' and pdf_percentage:
+        formats.append('svg')
+        joined_frame_count = max(frame_count_per_partition.values()) + image.get_extra_blank_frame_count(fps)
+        svg_interval = image.get_pdf_frame_step(joined_frame_count, pdf_percentage)
+    if mode == 'images':
+        os.makedirs(os.path.join(output_dir, 'frames_partition'), exist_ok=True) # GraphStream does not create the directory of the frames
+
+    # Run GraphStream on as many partitions at the same time as there are workers, each partition being submitted as soon as its DGS file is written
+    # (or straight away when streaming the DGS file through a FIFO while it is being written)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=pool.size) as executor:
+        futures = []
+        for index, sub_graph in enumerate(sub_graphs):
+            partition = sub_graph.graph['partition']
+            if dgs_mode == 'stream':
+                dgs_file = os.path.join(output_dir, 'partition_{}.dgs.fifo'.format(partition))
+            else:
+                with report.measure_partition(partition):
+                    dgs_file = file_io.write_dgs_file(output_dir, sub_graph, frame_start_and_count_per_partition, label_type, colour_attr, compress=dgs_mode == 'gzip')
+            svg_offset = max(frame_count_per_partition.get(partition, 0) - 1, 0) % svg_interval
+            job = functools.partial(generate_frames, pool, dgs_file, output_dir, index, layout, seed, force, attraction, repulsion,
+                                    stabilization, step_time, max_iterations, node_size_mode,
+                                    shadow_color, edge_size, label_size, cut_edge_length, width, height, mode, formats, svg_interval, svg_offset, render_threads, partition)
+            if dgs_mode == 'stream':
+                write_dgs = functools.partial(file_io.write_dgs_file, output_dir, sub_graph, frame_start_and_count_per_partition, label_type, colour_attr, dgs_file)
+                futures.append(executor.submit(report.profiled(graphstream.run_with_fifo), dgs_file, report.profiled(write_dgs), job)) # the DGS file is written on another thread
+            else:
+                futures.append(executor.submit(report.profiled(job)))
+        results = [future.result() for future in futures] # results in partition order
+
+    # Report failures per partition
+    failures = [(index, retval, log_file) for index, (_, retval, log_file) in enumerate(results) if retval != 0]
+    if failures:
+        for index, retval, log_file in failures:
+            logging.error("GraphStream failed on partition %d in %s mode (exit code %d). See %s for details", index, mode, retval, log_file)
+        sys.exit(1)
 
-    # Extract node positions from dot files
-    for index, sub_graph in enumerate(sub_graphs):
-        pos_per_node = graph.get_node_attribute_from_dot_file(dot_filepaths[index], '"pos"', True, True)
-        nx.set_node_attributes(sub_graph, name='pos', values=pos_per_node)
+    # Report the adaptive layout iterations per partition
+    if stabilization or step_time:
+        for index, (_, _, log_file) in enumerate(results):
+            iterations = graphstream.read_layout_iterations(log_file)
+            if iterations:
+                logging.info("Partition %d: %d layout iterations over %d steps in %s mode (%.1f per step, max %d)",
+                             index, sum(iterations), len(iterations), mode, sum(iterations) / len(iterations), max(iterations))
 
-def create_dgs_file_and_generate_frames(output_dir, sub_graphs, full_graph, label_type, colour_attr, trailing_frame_count,
-                                        layout, seed, force, attraction, repulsion, node_size_mode, shadow_color, edge_size, label_size, cut_edge_length, width, height, mode):
-    dot_filepaths = []
-    for index, sub_graph in enumerate(sub_graphs):
-        dgs_file = file_io.write_dgs_file(output_dir, sub_graph, full_graph, label_type, colour_attr, trailing_frame_count)
-        dot_filepath = generate_frames(dgs_file, output_dir, index, layout, seed, force, attraction, repulsion, node_size_mode,
-                                       shadow_color, edge_size, label_size, cut_edge_length, width, height, mode)
-        dot_filepaths.append(dot_filepath)
-    return dot_filepaths
+    return [dot_filepath for dot_filepath, _, _ in results]
 
-def create_clusters(sub_graphs, output_dir, scheme, clustering, cluster_seed, infomap_calls):
+def create_clusters(sub_graphs, full_graph, output_dir, scheme, clustering, cluster_seed, infomap_calls, jobs):
     clusters_per_node_per_graph = []
     if scheme == 'communities' and clustering != 'graphviz': # gvmap performs its own clustering if clustering=graphviz
         clusters_per_node_per_graph = perform_clustering(sub_graphs, output_dir, clustering,
-                                                         config['install_dirs']['oslom2'], config['install_dirs']['infomap'],
-                                                         cluster_seed, infomap_calls)
+                                                         config['install_dirs'].get('oslom2'), config['install_dirs'].get('infomap'),
+                                                         cluster_seed, infomap_calls, jobs)
         # Create local-cluster to global-cluster mapping for gvmap to see each cluster independently
         cluster.do_local_to_global_cluster_conversion(clusters_per_node_per_graph)
     elif scheme =='cut-edges':
-        clusters_per_node_per_graph = cluster.cluster_nodes_per_partition(sub_graphs)
+        clusters_per_node_per_graph = cluster.cluster_nodes_per_partition(sub_graphs, full_graph)
 
-    # Add clusters to graph as node attributes
-    if clusters_per_node_per_graph:
-        cluster.add_clusters_to_graph(sub_graphs, clusters_per_node_per_graph)
+    return clusters_per_node_per_graph
 
+def perform_clustering(sub_graphs, output_dir, clustering, oslom2_dir, infomap_dir, cluster_seed, infomap_calls, jobs):
+    # Run up to jobs clustering processes concurrently, each partition in its own directory
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(report.profiled(cluster_sub_graph), sub_graph, index, output_dir, clustering, oslom2_dir, infomap_dir, cluster_seed, infomap_calls)
+                   for index, sub_graph in enumerate(sub_graphs)]
+        clusters_per_node_per_graph = [future.result() for future in futures] # results in partition order
     return clusters_per_node_per_graph
 
-def perform_clustering(sub_graphs, output_dir, clustering, oslom2_dir, infomap_dir, cluster_seed, infomap_calls):
-    clusters_per_node_per_graph = []
-    for index, sub_graph in enumerate(sub_graphs):
-        logging.info("Performing clustering (%s) on sub-graph %d", clustering, index)
+def cluster_sub_graph(sub_graph, index, output_dir, clustering, oslom2_dir, infomap_dir, cluster_seed, infomap_calls):
+    logging.info("Performing clustering (%s) on sub-graph %d", clustering, index)
 
+    with report.measure_partition(sub_graph.graph['partition']):
         sub_graph_without_hidden_nodes = graph.filter_visible_graph(sub_graph)
 
-        clusters_per_node = run_clustering(output_dir, clustering, sub_graph_without_hidden_nodes, index, oslom2_dir, infomap_dir, cluster_seed, infomap_calls)
+        clusters_per_node = run_clustering(output_dir, clustering, sub_graph_without_hidden_nodes, index, oslom2_dir, infomap_dir, cluster_seed, infomap_calls,
+                                           sub_graph.graph['partition'])
         if clustering != 'graphviz': # clustering done directly by graphviz
             cluster.create_cluster_for_homeless_nodes(sub_graph_without_hidden_nodes, clusters_per_node) # add homeless nodes cluster
-        clusters_per_node_per_graph.append(clusters_per_node)
-    return clusters_per_node_per_graph
+    return clusters_per_node
 
-def run_clustering(output, clustering_method, graph, graph_id, oslom2_dir, infomap_dir, cluster_seed, infomap_calls):
+def run_clustering(output, clustering_method, graph, graph_id, oslom2_dir, infomap_dir, cluster_seed, infomap_calls, partition=None):
+    # graph_id is the index of the sub-graph (file names), partition its partition id (run report)
     clusters_per_node = {}
+    work_dir = os.path.join(output, "clustering_p{}".format(graph_id)) # per partition directory so that concurrent runs do not share files
     if graph.number_of_edges() == 0: # oslom2 and infomap do not support graphs with 0 edges
         clusters_per_node = {}
         cluster_index = 1
@@ -548,34 +773,36 @@ def run_clustering(output, clustering_method, graph, graph_id, oslom2_dir, infom
             clusters_per_node[node] = [cluster_index] # put each node in its own cluster
             cluster_index += 1
     elif clustering_method == 'oslom2':
-        oslom_edge_file = file_io.write_oslom_edge_file(output, "oslom_edge_file_{}".format(graph_id), graph)
-        cluster.run_oslom2(output, oslom_edge_file, oslom2_dir, cluster_seed, infomap_calls)
+        os.makedirs(work_dir, exist_ok=True)
+        oslom_edge_file = file_io.write_oslom_edge_file(work_dir, "oslom_edge_file_{}".format(graph_id), graph)
+        cluster.run_oslom2(work_dir, oslom_edge_file, oslom2_dir, cluster_seed, infomap_calls, partition)
         output_tp_file = os.path.join(oslom_edge_file + "_oslo_files", "tp") # or tp1 or tp2 (to be exposed as parameter)
         clusters_per_node = file_io.read_oslom2_tp_file(output_tp_file)
     elif clustering_method == 'infomap':
-        pajek_file = file_io.write_pajek_file(output, "pajek_file_{}".format(graph_id), graph)
-        cluster.run_infomap(output, pajek_file, infomap_dir, cluster_seed)
+        os.makedirs(work_dir, exist_ok=True)
+        pajek_file = file_io.write_pajek_file(work_dir, "pajek_file_{}".format(graph_id), graph)
+        cluster.run_infomap(work_dir, pajek_file, infomap_dir, cluster_seed, partition)
         output_tree_file = os.path.splitext(pajek_file)[0]+'.tree'
         level = 1 # lowest hierarchy level
         clusters_per_node = file_io.read_infomap_tree_file(output_tree_file, level) # get cluster(s) from Infomap .tree file
+    elif clustering_method == 'label-propagation':
+        clusters_per_node = cluster.run_label_propagation(graph, cluster_seed)
     return clusters_per_node
 
-def perform_coloring(sub_graphs, clusters_per_node_per_graph, output_dir, gvmap_dir, node_color, color_scheme, color_seed):
+def perform_coloring(sub_graphs, clusters_per_node_per_graph, output_dir, gvmap_dir, node_color, coloring, color_scheme, color_seed):
     if node_color:
-        colors_per_node = {node:node_color for node in nx.union_all(sub_graphs).nodes()}
+        colors_per_node = {node:node_color for sub_graph in sub_graphs for node in sub_graph.nodes()}
+    elif coloring == 'dsatur':
+        # Color clusters in process from the node positions and clusters
+        color_per_node = color.color_nodes_in_process(sub_graphs, clusters_per_node_per_graph, color_scheme, color_seed)
+        colors_per_node = color.get_colors_per_node_global(color_per_node, clusters_per_node_per_graph)
     else:
-        # Add width and height attributes (required by gvmap)
-        for sub_graph in sub_graphs:
-            attributes = {node:0.5 for node in sub_graph.nodes()}
-            graph.add_node_attribute_to_graph(sub_graph, 'height', attributes)
-            graph.add_node_attribute_to_graph(sub_graph, 'width', attributes)
-
         # Offset each subgraph to avoid them overlapping (required by gvmap)
-        graph.offset_graphs_to_avoid_overlaps(sub_graphs, 5000.0)
+        positions_per_graph = graph.offset_graphs_to_avoid_overlaps(sub_graphs, 5000.0)
 
-        # Merge sub-graphs for gvmap
+        # Merge sub-graphs for gvmap (with width and height attributes, required by gvmap)
         merged_graph_dot_filepath = os.path.join(output_dir, 'merged_graph.dot')
-        graph.merge_graphs(sub_graphs, merged_graph_dot_filepath)
+        graph.merge_graphs(sub_graphs, positions_per_graph, merged_graph_dot_filepath, 0.5)
 
         # Color nodes with gvmap
         gvmap_dot_file = color.color_nodes_with_gvmap(output_dir, color_scheme, color_seed, merged_graph_dot_filepath, gvmap_dir)
@@ -584,20 +811,24 @@ def perform_coloring(sub_graphs, clusters_per_node_per_graph, output_dir, gvmap_
         color_per_node = graph.get_node_attribute_from_dot_file(gvmap_dot_file, 'fillcolor', True, True)
         colors_per_node = color.get_colors_per_node_global(color_per_node, clusters_per_node_per_graph) # combine single color per node (from gvmap) and multiple clusters per node (from OSLOM2) to get multiple colors per node
 
-    # add colors to graphs
-    graph.add_node_attribute_to_subgraphs(sub_graphs, 'fillcolor', colors_per_node)
+    return colors_per_node
 
-def generate_frames(dgs_file, output, p, layout, seed, force, a, r, node_size_mode, shadow_color, edge_size, label_size, cut_edge_length, width, height, mode):
+def generate_frames(pool, dgs_file, output, p, layout, seed, force, a, r, stabilization, step_time, max_iterations, node_size_mode, shadow_color, edge_size, label_size, cut_edge_length, width, height, mode,
+                    formats, svg_interval, svg_offset, render_threads=1, partition=None):
+    # p is the index of the sub-graph (file names), partition its partition id (run report)
     output_dot_filepath = os.path.join(output, 'partition_{}.dot'.format(p))
+    trajectory_filepath = os.path.join(output, 'partition_{}.traj'.format(p)) # node positions per frame, recorded in dot mode and replayed in images mode
     out = os.path.join(output, 'frames_partition/p{}_'.format(p))
     if mode == 'dot':
         logging.info("Generating graph layout for DGS file %s and exporting it in dot file %s", dgs_file, output_dot_filepath)
     else:
         logging.info("Generating graph images (%s) for DGS file %s", out, dgs_file)
-    args = ['java', '-jar', DGSGS_JAR, '-dgs', dgs_file, '-out', out, '-layout', layout, '-seed', str(seed),
+    graphstream_log = os.path.join(output, "graphstream_{}_p{}.log".format(mode, p)) # one log per partition and mode
+    args = ['-dgs', dgs_file, '-out', out, '-layout', layout, '-seed', str(seed),
                     '-node_size_mode', node_size_mode, '-edge_size', str(edge_size), '-label_size', str(label_size),
                     '-width', str(width), '-height', str(height), '-cut_edge_length', str(cut_edge_length),
-                    '-mode', mode, '-dotfile', output_dot_filepath]
+                    '-mode', mode, '-dotfile', output_dot_filepath, '-trajectory', trajectory_filepath, '-log', graphstream_log,
+                    '-formats', ','.join(formats), '-svg_interval', str(svg_interval), '-svg_offset', str(svg_offset)]
     if force:
         args += ['-force', str(force)]
     if a:
@@ -606,22 +837,39 @@ def generate_frames(dgs_file, output, p, layout, seed, force, a, r, node_size_mo
         args += ['-r', str(r)]
     if shadow_color:
         args += ['-shadow_color', shadow_color]
-    logging.debug("dgs-graphstream.jar command: %s", ' '.join(args))
-    graphstream_log = os.path.join(output, "graphstream.log")
-    with open(graphstream_log, "w") as logwriter:
-        retval = subprocess.call(
-            args, cwd='.',
-            stdout=logwriter,
-            stderr=subprocess.STDOUT)
-    return output_dot_filepath
+    if stabilization:
+        args += ['-stabilization', str(stabilization)]
+    if step_time:
+        args += ['-step_time', str(step_time)]
+    if max_iterations:
+        args += ['-max_iterations', str(max_iterations)]
+    if mode == 'dot':
+        args += ['-positions', os.path.splitext(output_dot_filepath)[0] + '.pos']
+    elif render_threads > 1:
+        args += ['-render_threads', str(render_threads)]
+    metrics_filepath = os.path.join(output, "graphstream_{}_p{}.metrics.csv".format(mode, p)) # per-frame metrics, collected in the run report
+    if report.is_enabled():
+        args += ['-metrics', metrics_filepath]
+    logging.debug("dgs-graphstream.jar job: %s", ' '.join(args))
+    report_partition = p if partition is None else partition
+    start = time.perf_counter()
+    with report.measure_partition(report_partition):
+        retval, cpu_time = pool.run(args)
+    report.record_subprocess('graphstream {}'.format(mode), retval, time.perf_counter() - start, report_partition, cpu_time)
+    report.record_frame_metrics(report_partition, metrics_filepath)
+    return output_dot_filepath, retval, graphstream_log
 
 def create_video_from_tiles(output_directory, video_file, fps):
     logging.info("Creating video %s from tiles", video_file)
-    args = ['ffmpeg', '-framerate', str(fps), '-i', 'output/frames_joined/frame_%6d.png', '-pix_fmt', 'yuv420p', '-r', '10', video_file]
+    frames_pattern = os.path.join(output_directory, 'frames_joined', 'frame_%6d.png')
+    args = ['ffmpeg', '-framerate', str(fps), '-i', frames_pattern, '-pix_fmt', 'yuv420p', '-r', '10', video_file]
     logging.debug("ffmpeg command: %s", ' '.join(args))
     log_file = os.path.join(output_directory, "ffmpeg.log")
     with open(log_file, "w") as logwriter:
-        retval = subprocess.call(args, stdout=logwriter, stderr=subprocess.STDOUT)
+        retval = report.call('ffmpeg', args, stdout=logwriter, stderr=subprocess.STDOUT)
+    if retval != 0:
+        logging.error("See %s for details", log_file)
+        sys.exit(1)
 
 if __name__ == '__main__':
     # Initialize logging
@@ -633,9 +881,13 @@ if __name__ == '__main__':
 
     # Parse config file
     config = parse_config_file('config.ini')
-    validate_config(config)
+    validate_config(config, args)
 
-    # Run dgs-graphstream
-    run(args, config)
+    # Run dgs-graphstream (the run report is also written if the run fails)
+    try:
+        run(args, config)
+    finally:
+        if report.active_report:
+            report.active_report.write()
 
     logging.info("Done")
\ No newline at end of file
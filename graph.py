@@ -4,6 +4,7 @@ import logging
 import networkx as nx
 import pydot
 import itertools
+import numpy as np
 from scipy import interpolate
 
 import utils
@@ -32,55 +33,68 @@ def get_node_attribute_from_dot_file(filepath, attribute_name, to_int=False, str
 
 def create_sub_graphs(graph, partitions, assignments):
     logging.info("Splitting graph by partition into %d sub-graphs", len(partitions))
+    nodes_per_partition = {partition:[] for partition in partitions}
+    for n, p in assignments.items(): # group nodes by partition in a single pass
+        if p in nodes_per_partition:
+            nodes_per_partition[p].append(n)
     sub_graphs = []
     for partition in partitions:
-        sub_graph_nodes = [n for n,p in assignments.items() if p == partition]
-        sub_graph = graph.subgraph(sub_graph_nodes).copy() # make deep copy so that the graph is editable
+        sub_graph = graph.subgraph(nodes_per_partition[partition]).copy() # make deep copy so that the graph is editable
         sub_graph.graph['partition'] = partition
         for node in sub_graph.nodes():
             sub_graph.nodes[node]['partition'] = partition
         sub_graphs.append(sub_graph)
     return sub_graphs
 
-def get_pos(node):
-    return node[1]['pos'].split(',')
-
-def get_x(node):
-    return float(get_pos(node)[0])
-
-def get_y(node):
-    return float(get_pos(node)[1])
+def get_positions(graph):
+    ''' Node ids and (x, y) positions array of a laid out graph '''
+    return graph.graph['positions']
 
 def offset_graphs_to_avoid_overlaps(graphs, spacing):
+    ''' Positions of each graph translated horizontally so that the graphs don't overlap, the graphs are left unchanged '''
     logging.info("Offsetting %d graphs by %f horizontally to avoid overlaps", len(graphs), spacing)
     offset = 0.0
+    offset_positions_per_graph = []
     for graph in graphs:
-        node_positions = {}
-        # extract x values for current graph
-        x_values = [get_x(node) for node in graph.nodes(data=True)]
-        # apply offset to current graph
-        for node in graph.nodes(data=True):
-            node_positions[node[0]] = ','.join([str(get_x(node) + offset), str(get_y(node))])
-        add_node_attribute_to_graph(graph, '"pos"', node_positions)
-        # increment offset value to offset next graph by 10
-        if x_values:
-            offset += max(x_values) - min(x_values) + spacing
-
-def merge_graphs(graphs, output_dot_filepath):
+        node_ids, positions = get_positions(graph)
+        offset_positions_per_graph.append((node_ids, positions + (offset, 0.0)))
+        # increment offset value to place the next graph after the current one
+        if len(positions):
+            offset += np.ptp(positions[:, 0]) + spacing
+    return offset_positions_per_graph
+
+def merge_graphs(graphs, positions_per_graph, output_dot_filepath, node_size):
+    ''' Export the union of the graphs as a dot file with the given node positions, cluster and size (as expected by gvmap) '''
     logging.info("Merging %d graphs together and exporting dot file %s", len(graphs), output_dot_filepath)
-    merged_graph = nx.union_all(graphs)
-    nx.drawing.nx_pydot.write_dot(merged_graph, output_dot_filepath)
+    with open(output_dot_filepath, 'w') as f:
+        f.write('graph {\n')
+        for graph, (node_ids, positions) in zip(graphs, positions_per_graph):
+            pos_per_node = dict(zip(node_ids.tolist(), positions.tolist()))
+            lines = []
+            for node, data in graph.nodes(data=True):
+                attributes = ['height={}'.format(node_size), 'width={}'.format(node_size)]
+                if 'cluster' in data:
+                    attributes.append('cluster={}'.format(data['cluster']))
+                if node in pos_per_node:
+                    attributes.append('pos="{},{}"'.format(*pos_per_node[node]))
+                lines.append('"{}" [{}];\n'.format(node, ', '.join(attributes)))
+            for source, target, data in graph.edges(data=True):
+                if 'weight' in data:
+                    lines.append('"{}" -- "{}" [weight={}];\n'.format(source, target, data['weight']))
+                else:
+                    lines.append('"{}" -- "{}";\n'.format(source, target))
+            f.write(''.join(lines))
+        f.write('}\n')
 
 def add_cut_edges_to_subgraphs(input_graph, sub_graphs, assignments, cut_edge_node_size):
     # Get cut edges
-    cut_edges = get_cut_edges(input_graph, sub_graphs)
+    cut_edges_per_partition = get_cut_edges_per_partition(input_graph, assignments)
     # Add cut edges and hidden nodes to partition graphs
-    logging.info("Adding %d cut edges to the partition graphs", len(cut_edges))
+    logging.info("Adding %d cut edges to the partition graphs", sum(len(edges) for edges in cut_edges_per_partition.values()) // 2)
     available_node_id = max(input_graph.nodes()) + 1 # next available node id
     for sub_graph in sub_graphs:
-        sub_graph_cut_edges = [edge for edge in cut_edges if is_edge_connected_to_graph(edge, sub_graph)]
-        for edge in sub_graph_cut_edges:
-            internal_node, external_node = get_internal_external_nodes(edge, sub_graph)
+        sub_graph_cut_edges = cut_edges_per_partition.get(sub_graph.graph['partition'], [])
+        for internal_node, external_node in sub_graph_cut_edges:
             new_node = available_node_id
             sub_graph.add_node(new_node, hidden=1)
             available_node_id += 1
@@ -99,32 +113,36 @@ def add_cut_edges_to_subgraphs(input_graph, sub_graphs, assignments, cut_edge_no
             # insert node into assignments
             assignments[new_node] = assignments[internal_node]
 
-def is_edge_connected_to_graph(edge, graph):
-    return edge[0] in graph.nodes() or edge[1] in graph.nodes()
-
-def get_internal_external_nodes(edge, graph):
-    if edge[0] not in graph.nodes():
-        external_node = edge[0] # node from another partition
-        internal_node = edge[1] # node from current partition
-    elif edge[1] not in graph.nodes():
-        external_node = edge[1]
-        internal_node = edge[0]
-    else:
-        external_node = -1
-        internal_node = -1
-    return internal_node, external_node
-
-def get_cut_edges(input_graph, sub_graphs):
-    sub_graph_edges = list(itertools.chain.from_iterable([sub_graph.edges() for sub_graph in sub_graphs]))
-    sub_graph_nodes = list(itertools.chain.from_iterable([sub_graph.nodes() for sub_graph in sub_graphs]))
-    cut_edges = [edge for edge in input_graph.edges()
-                    if edge[0] in sub_graph_nodes
-                    and edge[1] in sub_graph_nodes
-                    and not is_edge_in_list(edge, sub_graph_edges)]
-    return cut_edges
-
-def is_edge_in_list(edge, edge_list):
-    return edge in edge_list or (edge[1], edge[0]) in edge_list # try both permutations
+def get_cut_edges_per_partition(input_graph, assignments):
+    '''
+    Cut edges (edges between 2 partitions) as (internal node, external node) pairs bucketed per partition,
+    in input graph edge order. Computed in a single pass over the edge array comparing the assignments of both ends.
+    '''
+    edges = np.fromiter(itertools.chain.from_iterable(input_graph.edges()), dtype=np.int64).reshape(-1, 2)
+    if len(edges) == 0:
+        return {}
+
+    # assignment array indexed by node id (-1 for excluded nodes)
+    assigned_nodes = np.fromiter(assignments.keys(), dtype=np.int64, count=len(assignments))
+    partition_per_node = np.full(max(assigned_nodes.max(), edges.max()) + 1, -1, dtype=np.int64)
+    partition_per_node[assigned_nodes] = np.fromiter(assignments.values(), dtype=np.int64, count=len(assignments))
+
+    # edges whose ends are in 2 different partitions (excluded nodes are in no partition)
+    source_partitions = partition_per_node[edges[:, 0]]
+    target_partitions = partition_per_node[edges[:, 1]]
+    is_cut_edge = (source_partitions != target_partitions) & (source_partitions != -1) & (target_partitions != -1)
+    cut_edges = edges[is_cut_edge]
+
+    # each cut edge belongs to the partitions of both its ends, with the end in the partition as internal node
+    partitions = np.concatenate((source_partitions[is_cut_edge], target_partitions[is_cut_edge]))
+    internal_nodes = np.concatenate((cut_edges[:, 0], cut_edges[:, 1]))
+    external_nodes = np.concatenate((cut_edges[:, 1], cut_edges[:, 0]))
+    edge_indexes = np.tile(np.arange(len(cut_edges)), 2)
+    sorted_entries = np.lexsort((edge_indexes, partitions)) # by partition, then in edge order
+    bucket_partitions, bucket_starts = np.unique(partitions[sorted_entries], return_index=True)
+    buckets = np.split(sorted_entries, bucket_starts[1:])
+    return {partition:list(zip(internal_nodes[bucket].tolist(), external_nodes[bucket].tolist()))
+            for partition, bucket in zip(bucket_partitions.tolist(), buckets) if len(bucket)}
 
 def filter_visible_graph(graph):
     visibe_nodes = [node for node in graph.nodes() if not 'hidden' in graph.nodes[node]]
@@ -158,12 +176,25 @@ def add_node_order_to_subgraphs(sub_graphs, node_order):
     # Get hidden nodes
     hidden_nodes = get_hidden_nodes(sub_graphs)
 
-    # Add hidden nodes to node_order list
-    for hidden_node, connected_nodes in hidden_nodes:
-        hidden_node_index = max(node_order.index(connected_nodes[0]), node_order.index(connected_nodes[1])) + 1 # hidden node get added after the last of the 2 nodes from the edge it represents
-        node_order.insert(hidden_node_index, hidden_node)
+    # Place hidden nodes in node_order
+    position_per_node = {node:index for index, node in enumerate(node_order)} # position index of the visible nodes
+    anchored_hidden_nodes = []
+    for index, (hidden_node, connected_nodes) in enumerate(hidden_nodes):
+        anchor_position = max(position_per_node[connected_nodes[0]], position_per_node[connected_nodes[1]]) # hidden node get added after the last of the 2 nodes from the edge it represents
+        anchored_hidden_nodes.append((anchor_position, -index, hidden_node)) # hidden nodes sharing the same anchor are placed in reverse order, the last one directly after the anchor
+    anchored_hidden_nodes.sort()
+
+    # Merge hidden nodes into node_order
+    ordered_nodes = []
+    hidden_index = 0
+    for position, node in enumerate(node_order):
+        ordered_nodes.append(node)
+        while hidden_index < len(anchored_hidden_nodes) and anchored_hidden_nodes[hidden_index][0] == position:
+            ordered_nodes.append(anchored_hidden_nodes[hidden_index][2])
+            hidden_index += 1
 
     # Add order as node attribute
+    order_per_node = {node:index + 1 for index, node in enumerate(ordered_nodes)} # order starts at 1
     for sub_graph in sub_graphs:
         for node in sub_graph.nodes():
-            sub_graph.nodes[node]['order'] = node_order.index(node) + 1 # order starts at 1
\ No newline at end of file
+            sub_graph.nodes[node]['order'] = order_per_node[node]
\ No newline at end of file
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+import os
+import logging
+import threading
+import subprocess
+import queue
+
+import report
+
+def read_layout_iterations(log_file):
+    ''' Layout iterations per step reported by an adaptive layout job ("#layout step <s> iterations <i> ..." lines) '''
+    iterations = []
+    if os.path.isfile(log_file):
+        with open(log_file, 'r') as f:
+            for line in f:
+                if line.startswith('#layout '):
+                    iterations.append(int(line.split()[4]))
+    return iterations
+
+def write_to_fifo(write_function):
+    try:
+        write_function()
+    except BrokenPipeError:
+        logging.debug("FIFO closed by the reader before the end of the input")
+
+def run_with_fifo(fifo_path, write_function, run_function):
+    '''
+    Run a job reading its input from a FIFO while write_function writes the input into it from another thread,
+    so that the job processes the first lines while the next ones are generated. Returns the result of run_function.
+    '''
+    if os.path.exists(fifo_path):
+        os.remove(fifo_path)
+    os.mkfifo(fifo_path)
+    writer = threading.Thread(target=write_to_fifo, args=(write_function,))
+    writer.start()
+    try:
+        return run_function()
+    finally:
+        if writer.is_alive(): # the job exited before reading the whole input, drain the FIFO to release the writer
+            fd = os.open(fifo_path, os.O_RDONLY | os.O_NONBLOCK)
+            try:
+                while writer.is_alive():
+                    try:
+                        data = os.read(fd, 1 << 16)
+                    except BlockingIOError:
+                        data = b''
+                    if not data:
+                        writer.join(0.01)
+            finally:
+                os.close(fd)
+        writer.join()
+        os.remove(fifo_path)
+
+class WorkerPool:
+    '''
+    Pool of long-lived DgsGraphStreamAnimate JVMs running in batch mode. Jobs are streamed
+    to each JVM's stdin (one job per line with tab-separated options) so that the JVM
+    startup and JIT warm-up costs are paid once per worker instead of once per job.
+    '''
+    def __init__(self, jar, size, log_dir):
+        self.jar = jar
+        self.size = size
+        self.log_dir = log_dir
+        self.lock = threading.Lock()
+        self.worker_count = 0
+        self.workers = queue.Queue()
+        for _ in range(size):
+            self.workers.put(self.start_worker())
+
+    def start_worker(self):
+        with self.lock:
+            worker_id = self.worker_count
+            self.worker_count += 1
+        log_file = os.path.join(self.log_dir, "graphstream_worker_{}.log".format(worker_id))
+        args = ['java', '-jar', self.jar, '-batch', '-']
+        logging.debug("Starting GraphStream worker %d: %s", worker_id, ' '.join(args))
+        with open(log_file, "w") as logwriter:
+            return subprocess.Popen(args, cwd='.',
+                                    stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE,
+                                    stderr=logwriter,
+                                    universal_newlines=True)
+
+    def run(self, args):
+        '''
+        Run a job on the next available worker and return its exit code (0 on success) and the CPU time
+        in seconds used by the worker during the job (None if not available)
+        '''
+        process = self.workers.get()
+        cpu_start = report.get_process_cpu_time(process.pid)
+        try:
+            process.stdin.write('\t'.join(args) + '\n')
+            process.stdin.flush()
+            # Skip any output that is not a job status line
+            line = process.stdout.readline()
+            while line and not line.startswith('#job '):
+                line = process.stdout.readline()
+        except BrokenPipeError:
+            line = ''
+        if not line: # the JVM died, replace it with a new worker
+            logging.error("GraphStream worker exited unexpectedly (exit code %s)", process.wait())
+            self.workers.put(self.start_worker())
+            return 1, None
+        cpu_end = report.get_process_cpu_time(process.pid)
+        self.workers.put(process)
+        cpu_time = cpu_end - cpu_start if cpu_start is not None and cpu_end is not None else None
+        return 0 if line.split()[2] == 'ok' else 1, cpu_time
+
+    def close(self):
+        ''' Stop all workers once their current job is done '''
+        while not self.workers.empty():
+            process = self.workers.get()
+            process.stdin.close()
+            process.wait()
@@ -1,24 +1,138 @@
 #!/usr/bin/env python3
 
 import os
+import sys
 import logging
-import subprocess
 import math
+import time
 import glob
+import subprocess
+import collections
+import concurrent.futures
 import fpdf
 from svglib.svglib import svg2rlg
 from reportlab.graphics import renderPDF
 from svgutils.compose import *
-from PIL import Image
+from PIL import Image, ImageDraw
+
+import report
+
+BACKGROUND_COLOR = (255, 255, 255) # white
+BORDER_COLOR = (223, 223, 223) # montage default border color (#DFDFDF)
+FRAMES_PER_TASK = 16 # maximum number of consecutive frames composed by a process when streaming frames
+STREAM_BUFFER_SIZE = 256 * 1024 * 1024 # maximum size in bytes of the raw frames composed ahead of ffmpeg when streaming frames
+
+def load_tile(tile):
+    ''' Decode a png tile as RGB, flattening transparent pixels on a white background '''
+    with Image.open(tile) as image:
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            rgb_image = Image.new('RGB', image.size, BACKGROUND_COLOR)
+            rgb_image.paste(image, mask=image.getchannel('A'))
+            return rgb_image
+        return image.convert('RGB')
+
+class TileCompositor:
+    '''
+    Combine tiles (one png per partition, None for a blank frame) into a grid of columns, with the same
+    output as "montage -tile <columns>x -geometry +0+0 -border <border_size>". The current frame is kept
+    between calls so that only the tiles which changed since the previous frame are decoded and pasted.
+    '''
+    def __init__(self, tile_count, columns, width, height, border_size):
+        self.border_size = border_size
+        self.cell_width = width + 2 * border_size
+        self.cell_height = height + 2 * border_size
+        self.columns = columns
+        self.frame = Image.new('RGB', get_tiled_frame_size(tile_count, columns, width, height, border_size), BACKGROUND_COLOR)
+        self.blank_tile = Image.new('RGB', (width, height), BACKGROUND_COLOR) # built once for all blank frames
+        self.tiles = [None] * tile_count # tile currently pasted in each cell
+        # draw the border around each tile, starting with blank tiles
+        draw = ImageDraw.Draw(self.frame)
+        for index in range(tile_count):
+            x, y = self.get_cell_offset(index)
+            draw.rectangle([x, y, x + self.cell_width - 1, y + self.cell_height - 1], fill=BORDER_COLOR)
+            self.frame.paste(self.blank_tile, (x + border_size, y + border_size))
+
+    def get_cell_offset(self, index):
+        return (index % self.columns) * self.cell_width, (index // self.columns) * self.cell_height
+
+    def compose(self, tiles):
+        ''' Frame made of the given tiles (only valid until the next call) '''
+        for index, tile in enumerate(tiles):
+            if tile != self.tiles[index]:
+                x, y = self.get_cell_offset(index)
+                self.frame.paste(load_tile(tile) if tile else self.blank_tile, (x + self.border_size, y + self.border_size))
+                self.tiles[index] = tile
+        return self.frame
+
+def get_tiled_frame_size(tile_count, columns, width, height, border_size):
+    rows = math.ceil(tile_count / columns)
+    return (width + 2 * border_size) * columns, (height + 2 * border_size) * rows
+
+def create_tiled_frames(tiles_per_frame, output_png_files, border_size, columns, width, height, raw=False):
+    '''
+    Compose consecutive frames, reusing the unchanged tiles of the previous frame. Each frame is written as png
+    unless its output file is None. Returns the raw RGB data of the frames if raw is set.
+    '''
+    compositor = TileCompositor(len(tiles_per_frame[0]), columns, width, height, border_size)
+    raw_frames = []
+    for tiles, output_png_file in zip(tiles_per_frame, output_png_files):
+        frame = compositor.compose(tiles)
+        if output_png_file:
+            frame.save(output_png_file, "PNG")
+        if raw:
+            raw_frames.append(frame.tobytes())
+    return raw_frames
+
+def get_stream_task_sizes(frame_size, jobs):
+    '''
+    Number of frames per task and maximum number of pending tasks when streaming frames, so that the raw frames
+    of the pending tasks and of the task being written to ffmpeg fit in STREAM_BUFFER_SIZE (at least one frame)
+    '''
+    frame_bytes = frame_size[0] * frame_size[1] * 3
+    frame_budget = max(1, STREAM_BUFFER_SIZE // frame_bytes) # frames held by the parent at the same time
+    frames_per_task = max(1, min(FRAMES_PER_TASK, frame_budget // (2 * jobs + 1)))
+    max_pending_tasks = max(1, min(2 * jobs, frame_budget // frames_per_task - 1))
+    return frames_per_task, max_pending_tasks
+
+def generate_tiled_frames(tiles_per_frame, output_png_files, border_size, columns, width, height, jobs):
+    ''' Raw RGB data of the tiled frames in frame order, composed by a process pool with a bounded size of pending frames '''
+    frame_size = get_tiled_frame_size(len(tiles_per_frame[0]), columns, width, height, border_size)
+    frames_per_task, max_pending_tasks = get_stream_task_sizes(frame_size, jobs)
+    logging.debug("Streaming %d frames per task with up to %d pending tasks", frames_per_task, max_pending_tasks)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = collections.deque()
+        for start in range(0, len(tiles_per_frame), frames_per_task):
+            end = start + frames_per_task
+            pending.append(executor.submit(create_tiled_frames, tiles_per_frame[start:end], output_png_files[start:end],
+                                           border_size, columns, width, height, True))
+            if len(pending) >= max_pending_tasks:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
 
-def create_png_tiles(tiles, border_size, columns, output_png_file):
-    args = ['/usr/bin/montage']
-    args += tiles
-    args += ['-tile', '{}x'.format(columns) , '-geometry', '+0+0', '-border', str(border_size), output_png_file]
-    logging.debug("montage command: %s", ' '.join(args))
-    retval = subprocess.call(
-        args, cwd='.',
-        stderr=subprocess.STDOUT)
+def stream_frames_to_video(output_directory, video_file, fps, frame_size, frames):
+    ''' Encode raw RGB frames with ffmpeg as they are produced '''
+    logging.info("Streaming tiles into video %s", video_file)
+    args = ['ffmpeg', '-y', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', '{}x{}'.format(*frame_size), '-framerate', str(fps), '-i', '-',
+            '-pix_fmt', 'yuv420p', '-r', '10', video_file]
+    logging.debug("ffmpeg command: %s", ' '.join(args))
+    log_file = os.path.join(output_directory, "ffmpeg.log")
+    start = time.perf_counter()
+    with open(log_file, "w") as logwriter:
+        process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=logwriter, stderr=subprocess.STDOUT)
+        try:
+            for frame in frames:
+                process.stdin.write(frame)
+        except BrokenPipeError:
+            pass # ffmpeg failed, reported below
+        finally:
+            process.stdin.close()
+        retval, cpu_time = report.wait(process)
+    report.record_subprocess('ffmpeg', retval, time.perf_counter() - start, cpu_time=cpu_time)
+    if retval != 0:
+        logging.error("ffmpeg failed with exit code %d, see %s", retval, log_file)
+        sys.exit(1)
 
 def create_svg_tiles(svg_tiles, output_svg_file, width, height, border_size, columns):
     rows = math.ceil(len(svg_tiles) / columns) # number of rows
@@ -49,7 +163,12 @@ def create_svg_tiles(svg_tiles, output_svg_file, width, height, border_size, col
        *svg_objects
        ).save(output_svg_file)
 
-def combine_images_into_tiles(output, partitions, border_size, width, height, fps):
+def combine_images_into_tiles(output, partitions, border_size, width, height, fps, jobs, pdf_percentage, video_file=None):
+    '''
+    Combine the partition frames into tiled frames. If video_file is given, the frames are streamed into the video
+    and only the png files needed by the pdf export are written. Svg frames are only composed for the frames
+    exported as pdf (none without pdf_percentage) and returned in export order.
+    '''
     logging.info("Combining images into tiles")
     partitions_count = len(partitions)
 
@@ -60,7 +179,7 @@ def combine_images_into_tiles(output, partitions, border_size, width, height, fp
         frames[p] = sorted(glob.glob(path_glob))
 
     max_frame_count_per_partition = max([len(frames[p]) for p in frames]) # max number of frames per partition
-    extra_blank_frame_count = math.ceil(0.5 * fps) # number of extra blank frames to insert at the start
+    extra_blank_frame_count = get_extra_blank_frame_count(fps)
     frame_count = max_frame_count_per_partition + extra_blank_frame_count
 
     # create output folder
@@ -71,40 +190,55 @@ def combine_images_into_tiles(output, partitions, border_size, width, height, fp
     # compute number of rows and columns
     columns = math.ceil(math.sqrt(partitions_count))
 
-    # create blank frame png
-    blank_frame_path = os.path.join(output, 'frame_blank.png')
-    blank_frame = Image.new('RGB', (width, height), (255, 255, 255)) # create white frame
-    blank_frame.save(blank_frame_path, "PNG")
-
-    # insert white frames at the start to get the same number of frames per partition and start with a few blank frames
+    # insert blank frames (None) at the start to get the same number of frames per partition and start with a few blank frames
     for p in range(0, partitions_count):
-        frames[p] = [blank_frame_path] * (frame_count - len(frames[p])) + frames[p]
+        frames[p] = [None] * (frame_count - len(frames[p])) + frames[p]
 
+    tiles_per_frame = []
     frame_files_png = []
-    frame_files_svg = []
     f = 0
-    for _ in xrange(frame_count):
+    for _ in range(frame_count):
         try:
             # get all tiles for current frame (one tile per partition)
             tiles = [frames[p][f] for p in range(0, partitions_count)]
+            tiles_per_frame.append(tiles)
 
-            # create png tiles
+            # png tiles are created below
             png_frame_file = os.path.join(path_joined, 'frame_{0:06d}.png'.format(f))
             frame_files_png.append(png_frame_file)
-            create_png_tiles(tiles, border_size, columns, png_frame_file)
-
-            # create svg tiles
-            svg_frame_file = os.path.join(path_joined, 'frame_{0:06d}.svg'.format(f))
-            frame_files_svg.append(svg_frame_file)
-            svg_tiles = [os.path.splitext(tile)[0]+'.svg' for tile in tiles] # replace .png by .svg
-            svg_tiles = [svg_tile if os.path.isfile(svg_tile) else '' for svg_tile in svg_tiles ] # replace missing files by blank frames
-            create_svg_tiles(svg_tiles, svg_frame_file, width, height, border_size, columns)
 
             f += 1
 
         except IndexError:
             print('Missing frame p{}_{}'.format(p, f))
 
+    pdf_frame_indexes = get_pdf_frame_indexes(len(frame_files_png), pdf_percentage) if pdf_percentage else []
+    if video_file:
+        # stream frames into the video, only writing the png files exported as pdf
+        pdf_frames = set(pdf_frame_indexes)
+        output_png_files = [png_file if index in pdf_frames else None for index, png_file in enumerate(frame_files_png)]
+        frame_size = get_tiled_frame_size(partitions_count, columns, width, height, border_size)
+        frames = generate_tiled_frames(tiles_per_frame, output_png_files, border_size, columns, width, height, jobs)
+        stream_frames_to_video(output, video_file, fps, frame_size, frames)
+    else:
+        # create png tiles, each process handling a range of consecutive frames to reuse unchanged tiles
+        chunk_size = math.ceil(len(tiles_per_frame) / jobs)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(create_tiled_frames, tiles_per_frame[start:start + chunk_size], frame_files_png[start:start + chunk_size],
+                                       border_size, columns, width, height)
+                       for start in range(0, len(tiles_per_frame), chunk_size)]
+            for future in futures:
+                future.result()
+
+    # create svg tiles of the frames exported as pdf
+    frame_files_svg = []
+    for index in pdf_frame_indexes:
+        svg_frame_file = os.path.join(path_joined, 'frame_{0:06d}.svg'.format(index))
+        frame_files_svg.append(svg_frame_file)
+        svg_tiles = [os.path.splitext(tile)[0]+'.svg' if tile else '' for tile in tiles_per_frame[index]] # replace .png by .svg
+        svg_tiles = [svg_tile if os.path.isfile(svg_tile) else '' for svg_tile in svg_tiles ] # replace missing files by blank frames
+        create_svg_tiles(svg_tiles, svg_frame_file, width, height, border_size, columns)
+
     return frame_files_png, frame_files_svg
 
 def write_png_to_pdf(png_file, output_dir):
@@ -119,14 +253,23 @@ def write_svg_to_pdf(svg_file, output_dir):
     drawing = svg2rlg(svg_file)
     renderPDF.drawToFile(drawing, pdf_file)
 
-def create_pdfs_from_tiles(output_dir, frame_files_svg, pdf_percentage):
+def get_extra_blank_frame_count(fps):
+    return math.ceil(0.5 * fps) # number of extra blank frames to insert at the start
+
+def get_pdf_frame_step(frame_count, pdf_percentage):
+    return max(1, int(pdf_percentage / 100.0 * frame_count))
+
+def get_pdf_frame_indexes(frame_count, pdf_percentage):
+    ''' Indexes of the frames exported as pdf: every pdf_percentage% of the frames, starting from the last frame '''
+    step = get_pdf_frame_step(frame_count, pdf_percentage)
+    logging.info("Exporting every %d frames (every %d%%) as pdf", step, pdf_percentage)
+    return list(reversed(range(frame_count)))[0::step]
+
+def create_pdfs_from_tiles(output_dir, frame_files_svg):
+    # frame_files_svg only contains the frames selected by get_pdf_frame_indexes
     pdf_dir = os.path.join(output_dir, 'pdf')
     if not os.path.exists(pdf_dir):
         os.makedirs(pdf_dir)
-    # filter frames to be converted to pdfs
-    step = int(pdf_percentage / 100.0 * len(frame_files_svg))
-    logging.info("Exporting every %d frames (every %d%%) as pdf", step, pdf_percentage)
-    filtered_frame_files = list(reversed(frame_files_svg))[0::step]
-    for frame_file in filtered_frame_files:
+    for frame_file in frame_files_svg:
         write_png_to_pdf(os.path.splitext(frame_file)[0]+'.png', pdf_dir) # TEMPORARY (for validation)
         write_svg_to_pdf(frame_file, pdf_dir)
\ No newline at end of file
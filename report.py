@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+
+import os
+import csv
+import json
+import time
+import pstats
+import cProfile
+import logging
+import functools
+import resource
+import threading
+import subprocess
+import contextlib
+import numpy as np
+
+active_report = None # report of the current run, the subprocesses are recorded in its current stage
+
+class MemorySampler(threading.Thread):
+    ''' Peak resident memory of the process, sampled every interval seconds (lifetime peak if /proc is not available) '''
+    def __init__(self, interval=0.05): # coarse enough not to compete for the GIL with the measured code
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_rss = 0
+        self.stopped = threading.Event()
+
+    def get_rss(self):
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+
+    def start(self):
+        if os.path.isfile('/proc/self/statm'):
+            super().start()
+
+    def run(self):
+        while True:
+            self.peak_rss = max(self.peak_rss, self.get_rss())
+            if self.stopped.wait(self.interval):
+                break
+
+    def stop(self):
+        if self.ident is None: # not started
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        self.stopped.set()
+        self.join()
+        return self.peak_rss
+
+def get_process_cpu_time(pid):
+    ''' User and system CPU time in seconds of a running process (None if /proc is not available) '''
+    try:
+        with open('/proc/{}/stat'.format(pid), 'r') as f:
+            fields = f.read().rsplit(')', 1)[1].split() # the process name may contain spaces
+    except (OSError, IndexError):
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK') # utime and stime (fields 14 and 15)
+
+def wait(process):
+    ''' Wait for a subprocess.Popen process, returns its exit code and CPU time in seconds '''
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    return process.returncode, rusage.ru_utime + rusage.ru_stime
+
+def get_file_count_and_size(path):
+    file_count = 0
+    size = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            filepath = os.path.join(root, file)
+            if os.path.isfile(filepath): # skip FIFOs and broken links
+                file_count += 1
+                size += os.path.getsize(filepath)
+    return file_count, size
+
+FRAME_TIMINGS = ['highlight', 'layout', 'cut_edges', 'snapshot', 'svg', 'png'] # per-frame timings written by DgsGraphStreamAnimate -metrics
+
+def is_enabled():
+    ''' Whether a run report is being recorded '''
+    return active_report is not None and active_report.filepath is not None
+
+def summarize_frame_metrics(filepath):
+    ''' Summary of the per-frame metrics written by DgsGraphStreamAnimate (timings in seconds) '''
+    with open(filepath, 'r') as f:
+        records = sorted(csv.DictReader(f), key=lambda record: int(record['frame'])) # rows are written in rendering order with -render_threads
+    if not records:
+        return {'frames': 0}
+    summary = {'frames': len(records),
+               'nodes': int(records[-1]['nodes']),
+               'edges': int(records[-1]['edges']),
+               'layout_iterations': sum(int(record['layout_iterations']) for record in records)}
+    if records[-1]['stabilization']:
+        summary['final_stabilization'] = float(records[-1]['stabilization'])
+    for timing in FRAME_TIMINGS:
+        times = np.array([int(record[timing + '_ns']) for record in records], dtype=np.float64) / 1e9
+        summary[timing + '_time'] = {'total': round(times.sum(), 4), 'mean': round(times.mean(), 6), 'max': round(times.max(), 6)}
+    return summary
+
+def record_frame_metrics(partition, filepath):
+    ''' Add the summary of the per-frame metrics of a partition to the current stage of the active report '''
+    if is_enabled() and os.path.isfile(filepath):
+        active_report.set_counts(active_report.current_stage or 'other', partition, frame_metrics=summarize_frame_metrics(filepath), frame_metrics_file=filepath)
+
+def record_subprocess(name, retval, duration, partition=None, cpu_time=None):
+    ''' Record the exit code, duration and CPU time of a subprocess (or GraphStream job) in the current stage of the active report '''
+    if active_report:
+        active_report.add_subprocess(name, retval, duration, partition, cpu_time)
+
+@contextlib.contextmanager
+def measure_partition(partition):
+    ''' Add the wall time and the CPU time of the current thread spent in this context to a partition of the current stage '''
+    if not is_enabled():
+        yield
+        return
+    wall_start, cpu_start = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        active_report.add_partition_times(partition, time.perf_counter() - wall_start, time.thread_time() - cpu_start)
+
+def profiled(function):
+    '''
+    Wrap a function run on a pool thread so that it is profiled with cProfile when the current stage is (cProfile only
+    profiles the thread enabling it), its statistics are merged into those of the stage
+    '''
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not is_enabled() or not active_report.cprofile:
+            return function(*args, **kwargs)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError: # Python >= 3.12: one profiler at a time, the profiler of the stage already sees every thread
+            return function(*args, **kwargs)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profiler.disable()
+            active_report.add_thread_profile(profiler)
+    return wrapper
+
+def call(name, args, partition=None, **kwargs):
+    ''' subprocess.call logging a non-zero exit code and recording the exit code, duration and CPU time in the active report '''
+    start = time.perf_counter()
+    with subprocess.Popen(args, **kwargs) as process:
+        retval, cpu_time = wait(process)
+    record_subprocess(name, retval, time.perf_counter() - start, partition, cpu_time)
+    if retval != 0:
+        logging.error("%s failed with exit code %d", name, retval)
+    return retval
+
+class RunReport:
+    '''
+    Structured report of a run. For each stage: wall and CPU time (of the process and of its terminated
+    subprocesses), peak memory, number of files and bytes written in the output directory, node/edge/frame
+    counts (in total and per partition) and the exit code, duration and CPU time of each subprocess. Per
+    partition, the wall and thread CPU time of the partition work and the CPU time of its subprocesses are
+    summed. The statistics of each stage can also be profiled with cProfile, the functions run on pool threads
+    being profiled when wrapped with profiled(). The report is disabled when no filepath is given.
+
+    The GraphStream JVM workers are long-lived, they are only counted in children_cpu_time of the stage
+    reaping them. Their CPU time is instead measured per job (from /proc) in subprocess_cpu_time.
+    '''
+    def __init__(self, filepath, output_dir, cprofile=False):
+        self.filepath = filepath
+        self.output_dir = output_dir
+        self.cprofile = cprofile
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.current_stage = None
+        self.thread_profiles = [] # cProfile profilers of the pool threads of the current stage
+        self.start_time = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        ''' Measure the code run in this context as the given stage '''
+        if not self.filepath:
+            yield
+            return
+        with self.lock:
+            self.stages[name] = {'counts': {}, 'partitions': {}, 'subprocesses': []}
+            self.current_stage = name
+            self.thread_profiles = []
+        files_before, bytes_before = get_file_count_and_size(self.output_dir)
+        children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        sampler = MemorySampler()
+        sampler.start()
+        profiler = cProfile.Profile() if self.cprofile else None
+        if profiler:
+            profiler.enable()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall_time, cpu_time = time.perf_counter() - wall_start, time.process_time() - cpu_start
+            if profiler:
+                profiler.disable()
+            children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            files_after, bytes_after = get_file_count_and_size(self.output_dir)
+            with self.lock:
+                self.stages[name].update({
+                    'wall_time': round(wall_time, 4),
+                    'cpu_time': round(cpu_time, 4),
+                    'children_cpu_time': round(children_after.ru_utime + children_after.ru_stime - children_before.ru_utime - children_before.ru_stime, 4), # subprocesses terminated during the stage
+                    'peak_rss': sampler.stop(),
+                    'children_peak_rss': children_after.ru_maxrss * 1024, # peak of all the terminated subprocesses so far
+                    'files_written': files_after - files_before,
+                    'bytes_written': bytes_after - bytes_before})
+                self.current_stage = None
+            if profiler:
+                profile_file = os.path.splitext(self.filepath)[0] + '_{}.prof'.format(name)
+                stats = pstats.Stats(profiler)
+                with self.lock:
+                    thread_profiles, self.thread_profiles = self.thread_profiles, []
+                for thread_profile in thread_profiles:
+                    stats.add(thread_profile)
+                stats.dump_stats(profile_file)
+                logging.debug("cProfile statistics of the %s stage written to %s", name, profile_file)
+
+    def set_counts(self, stage, partition=None, **counts):
+        ''' Set counts (nodes, edges, frames...) of a stage, in total or for a partition '''
+        if not self.filepath:
+            return
+        with self.lock:
+            stage_report = self.stages.setdefault(stage, {'counts': {}, 'partitions': {}, 'subprocesses': []})
+            if partition is None:
+                stage_report['counts'].update(counts)
+            else:
+                stage_report['partitions'].setdefault(str(partition), {}).update(counts)
+
+    def add_subprocess(self, name, retval, duration, partition=None, cpu_time=None):
+        if not self.filepath:
+            return
+        with self.lock:
+            stage_report = self.stages.setdefault(self.current_stage or 'other', {'counts': {}, 'partitions': {}, 'subprocesses': []})
+            stage_report['subprocesses'].append({'name': name, 'partition': partition, 'exit_code': retval, 'duration': round(duration, 4),
+                                                 'cpu_time': round(cpu_time, 4) if cpu_time is not None else None})
+            if cpu_time is not None:
+                stage_report['subprocess_cpu_time'] = round(stage_report.get('subprocess_cpu_time', 0) + cpu_time, 4)
+                if partition is not None:
+                    partition_report = stage_report['partitions'].setdefault(str(partition), {})
+                    partition_report['subprocess_cpu_time'] = round(partition_report.get('subprocess_cpu_time', 0) + cpu_time, 4)
+
+    def add_thread_profile(self, profiler):
+        ''' Add the cProfile profiler of a pool thread to the statistics of the current stage '''
+        with self.lock:
+            self.thread_profiles.append(profiler)
+
+    def add_partition_times(self, partition, wall_time, cpu_time):
+        ''' Add wall and CPU time to a partition of the current stage '''
+        if not self.filepath:
+            return
+        with self.lock:
+            stage_report = self.stages.setdefault(self.current_stage or 'other', {'counts': {}, 'partitions': {}, 'subprocesses': []})
+            partition_report = stage_report['partitions'].setdefault(str(partition), {})
+            partition_report['wall_time'] = round(partition_report.get('wall_time', 0) + wall_time, 4)
+            partition_report['cpu_time'] = round(partition_report.get('cpu_time', 0) + cpu_time, 4)
+
+    def write(self):
+        if not self.filepath:
+            return
+        with self.lock:
+            run_report = {'wall_time': round(time.perf_counter() - self.start_time, 4),
+                          'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+                          'stages': self.stages}
+        with open(self.filepath, 'w') as f:
+            json.dump(run_report, f, indent=2)
+        logging.info("Run report written to %s", self.filepath)